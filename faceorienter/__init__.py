@@ -1 +1,2 @@
-from .faceorienter import FaceOrienter
\ No newline at end of file
+from .faceorienter import FaceOrienter, predict_orientations_from_landmarks
+from .batch import predict_orientations
\ No newline at end of file
@@ -0,0 +1,81 @@
+from functools import partial
+from multiprocessing import get_all_start_methods, get_context, get_start_method
+
+import numpy as np
+
+from . import models
+from .faceorienter import FaceOrienter
+
+
+def _predict(kwargs, indexed_image):
+    """
+    Predicts the orientation of a single image. Runs inside the worker processes, which inherit the models loaded by the
+    parent process (or, depending on the multiprocessing start method, load them once, see `faceorienter.models`).
+
+    Parameters
+    ----------
+    kwargs : dict
+        Passed on to the FaceOrienter constructor
+    indexed_image : (int, str | bytes | numpy.ndarray)
+        Position of the image in the input, and the image itself (path, encoded bytes or decoded BGR array)
+
+    Returns
+    -------
+    (int, str)
+        Position of the image in the input, and its predicted orientation
+    """
+    i, image = indexed_image
+
+    if isinstance(image, np.ndarray):
+        face_orienter = FaceOrienter.from_array(image, **kwargs)
+    elif isinstance(image, (bytes, bytearray, memoryview)):
+        face_orienter = FaceOrienter.from_bytes(image, **kwargs)
+    else:
+        face_orienter = FaceOrienter(image, **kwargs)
+
+    return i, face_orienter.predict_orientation()
+
+
+def predict_orientations(images, workers=None, ordered=True, chunksize=1, **kwargs):
+    """
+    Predicts the orientations of many images using a pool of worker processes. Images are consumed lazily and results
+    are streamed back as they become available, so arbitrarily large inputs can be processed.
+
+    Parameters
+    ----------
+    images : iterable of str | bytes | numpy.ndarray
+        Image paths, encoded images or decoded BGR images (may be mixed)
+    workers : int | None
+        Number of worker processes (defaults to the number of CPUs). If 1, images are processed in the current process.
+    ordered : bool
+        If True, results are yielded in input order. Otherwise they are yielded as soon as they are completed.
+    chunksize : int
+        Number of images sent to a worker at once (larger values reduce the inter-process overhead for small images)
+    kwargs
+        Passed on to the FaceOrienter constructor (e.g. `max_detection_side`)
+
+    Yields
+    ------
+    (int, str)
+        Position of the image in the input, and its predicted orientation (up/down/right/left)
+    """
+    indexed_images = enumerate(images)
+    predict = partial(_predict, kwargs)
+
+    if workers == 1:
+        for result in map(predict, indexed_images):
+            yield result
+        return
+
+    # Use the configured start method, or the platform's default, without fixing it for the whole process (so that
+    # callers can still set it later)
+    context = get_context(get_start_method(allow_none=True) or get_all_start_methods()[0])
+
+    # Load the models before forking, so that the workers share them (instead of each loading its own copy)
+    if context.get_start_method() == 'fork':
+        models.warmup()
+
+    with context.Pool(workers) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for result in imap(predict, indexed_images, chunksize):
+            yield result
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache(object):
+    """
+    Base class of caches for orientation predictions, keyed by a hash of the raw (encoded) image bytes. Counts hits and
+    misses (thread-safely, as a cache may be shared by many threads). Subclasses implement `_get` and `_set`.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def make_key(image_bytes, options=''):
+        """
+        Creates a cache key from an encoded image and the options that influence the prediction (so that predictions
+        made using different options are cached separately).
+
+        Parameters
+        ----------
+        image_bytes : bytes | bytearray | memoryview
+            The encoded image
+        options : str
+            A representation of the prediction options
+
+        Returns
+        -------
+        str
+            The cache key
+        """
+        return hashlib.sha256(image_bytes).hexdigest() + options
+
+    def get(self, key):
+        """
+        Parameters
+        ----------
+        key : str
+            The cache key (see `make_key`)
+
+        Returns
+        -------
+        dict | None
+            The cached prediction (with the keys `orientation`, `confidence`, `landmarks`, `n_rotations`, etc.), or
+            None on a miss
+        """
+        value = self._get(key)
+        with self.__lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return value
+
+    def set(self, key, value):
+        """
+        Parameters
+        ----------
+        key : str
+            The cache key (see `make_key`)
+        value : dict
+            The prediction (must be JSON-serializable)
+        """
+        self._set(key, value)
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value):
+        raise NotImplementedError
+
+
+class LRUCache(PredictionCache):
+    """In-process cache that evicts the least recently used entries, and entries older than `ttl` seconds"""
+    def __init__(self, max_size=1024, ttl=None):
+        """
+        Parameters
+        ----------
+        max_size : int
+            Maximum number of entries
+        ttl : float | None
+            Time (in seconds) after which an entry expires (None means never)
+        """
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def _get(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+
+            value, created = entry
+            if self.ttl is not None and time.time() - created > self.ttl:
+                del self.__entries[key]
+                return None
+
+            self.__entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self.__lock:
+            self.__entries[key] = (value, time.time())
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+
+class SqliteCache(PredictionCache):
+    """
+    On-disk cache backed by a SQLite database, which can be shared between processes (e.g. server workers). Evicts the
+    oldest entries (by insertion), and entries older than `ttl` seconds.
+    """
+    def __init__(self, path, max_size=100000, ttl=None):
+        """
+        Parameters
+        ----------
+        path : str
+            Path to the database file (created if it doesn't exist)
+        max_size : int
+            Maximum number of entries
+        ttl : float | None
+            Time (in seconds) after which an entry expires (None means never)
+        """
+        super().__init__()
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # Connections can neither be shared between threads nor between forked processes
+        self.__local = threading.local()
+
+    def __connection(self):
+        if getattr(self.__local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS predictions '
+                               '(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)')
+            self.__local.connection, self.__local.pid = connection, os.getpid()
+
+        return self.__local.connection
+
+    def __len__(self):
+        return self.__connection().execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+
+    def _get(self, key):
+        connection = self.__connection()
+        row = connection.execute('SELECT value, created FROM predictions WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+
+        value, created = row
+        if self.ttl is not None and time.time() - created > self.ttl:
+            with connection:
+                connection.execute('DELETE FROM predictions WHERE key = ?', (key,))
+            return None
+
+        return json.loads(value)
+
+    def _set(self, key, value):
+        connection = self.__connection()
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO predictions (key, value, created) VALUES (?, ?, ?)',
+                               (key, json.dumps(value), time.time()))
+
+            # Rowids increase with every insertion, so this evicts the oldest entries
+            connection.execute('DELETE FROM predictions WHERE rowid <= (SELECT MAX(rowid) FROM predictions) - ?',
+                               (self.max_size,))
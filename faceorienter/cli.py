@@ -0,0 +1,268 @@
+import glob
+import json
+import os
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import cpu_count, get_all_start_methods, get_context, get_start_method
+
+from . import models
+from .faceorienter import FaceOrienter
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+
+def iter_images(source, extensions=IMAGE_EXTENSIONS):
+    """
+    Lazily lists the images of a directory tree, a glob pattern or a JSONL manifest.
+
+    Manifest lines are either JSON objects with a `path` key, or JSON strings. Relative paths are relative to the
+    manifest's directory.
+
+    Parameters
+    ----------
+    source : str
+        A directory, a glob pattern (e.g. `photos/**/*.jpg`), or a manifest (`.jsonl`)
+    extensions : tuple of str
+        File extensions of images (only used for directories)
+
+    Yields
+    ------
+    (str, str)
+        The image's path, and its path relative to the source (used to name output files)
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for file_name in sorted(files):
+                if os.path.splitext(file_name)[1].lower() in extensions:
+                    path = os.path.join(root, file_name)
+                    yield path, os.path.relpath(path, source)
+    elif source.endswith('.jsonl'):
+        base_dir = os.path.dirname(source)
+        with open(source, 'r') as manifest:
+            for line in manifest:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                path = entry['path'] if isinstance(entry, dict) else entry
+                yield os.path.join(base_dir, path), os.path.normpath(path).lstrip(os.sep)
+    else:
+        # Output files are named relative to the pattern's longest directory prefix without wildcards
+        base_dir = source
+        while glob.has_magic(base_dir):
+            base_dir = os.path.dirname(base_dir)
+        for path in glob.iglob(source, recursive=True):
+            if os.path.isfile(path):
+                yield path, os.path.relpath(path, base_dir)
+
+
+def get_output_path(output_dir, relative_path):
+    """
+    Parameters
+    ----------
+    output_dir : str
+        The output directory
+    relative_path : str
+        The path of the output file relative to `output_dir` (e.g. from a manifest)
+
+    Returns
+    -------
+    str
+        The path of the output file
+
+    Raises
+    ------
+    ValueError
+        If the output file would not be located inside `output_dir` (e.g. due to `..` components)
+    """
+    output_dir = os.path.realpath(output_dir)
+    output_path = os.path.realpath(os.path.join(output_dir, relative_path))
+    if os.path.commonpath([output_dir, output_path]) != output_dir or output_path == output_dir:
+        raise ValueError('Output path `%s` is outside of the output directory.' % relative_path)
+
+    return output_path
+
+
+def _process_image(path, output_dir, relative_path, lossless, kwargs):
+    """
+    Predicts the orientation of an image, and writes the fixed image to `output_dir` (if set). Runs inside the worker
+    processes. Errors are returned instead of raised, so that a single broken image (or output path outside of
+    `output_dir`) doesn't stop the whole run.
+
+    Returns
+    -------
+    dict
+        The result, as written to the results file
+    """
+    result = {'path': path}
+    try:
+        output_path = get_output_path(output_dir, relative_path) if output_dir is not None else None
+        fo = FaceOrienter(path, **kwargs)
+        result['orientation'], result['confidence'] = fo.predict_orientation_with_confidence()
+        result['n_rotations'] = fo.n_rotations
+        if output_path is not None:
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+            fo.fix_orientation(output_path, lossless=lossless)
+            result['output_path'] = output_path
+        if fo.peak_memory is not None:
+            result['peak_memory'] = fo.peak_memory
+    except Exception as e:
+        result['error'] = '%s: %s' % (e.__class__.__name__, str(e))
+
+    return result
+
+
+def _read_checkpoint(results_path):
+    """
+    Returns the paths of all images that have already been processed according to a results file. A partially written
+    last line (e.g. after a crash) is removed from the file.
+    """
+    processed = set()
+    if not os.path.isfile(results_path):
+        return processed
+
+    with open(results_path, 'rb+') as results_file:
+        complete_size = 0
+        for line in results_file:
+            if not line.endswith(b'\n'):
+                break
+            complete_size += len(line)
+            try:
+                processed.add(json.loads(line.decode('utf-8'))['path'])
+            except (ValueError, KeyError):
+                continue
+        results_file.truncate(complete_size)
+
+    return processed
+
+
+def process_images(images, output_dir=None, results_path=None, resume=False, workers=None, max_in_flight=None,
+                   lossless=False, **kwargs):
+    """
+    Processes images in parallel, keeping at most `max_in_flight` images in flight at once (so the input is consumed
+    lazily, and memory usage is bounded). Results are written incrementally (in order of completion) to a JSONL file,
+    which also serves as checkpoint: when resuming, images already listed in it are skipped.
+
+    Parameters
+    ----------
+    images : iterable of (str, str)
+        Image paths, and paths of the output files relative to `output_dir` (see `iter_images`). Images whose output
+        file would be located outside of `output_dir` are rejected (see `get_output_path`)
+    output_dir : str | None
+        Directory to which fixed images are written (None means no images are written)
+    results_path : str | None
+        Path of the results file (JSONL)
+    resume : bool
+        Whether to skip images that are listed in the results file already (otherwise, it is overwritten)
+    workers : int | None
+        Number of worker processes (defaults to the number of CPUs)
+    max_in_flight : int | None
+        Maximum number of images submitted to the workers at once (defaults to 4 times the number of workers)
+    lossless : bool
+        Whether JPEGs should be rotated losslessly, if possible
+    kwargs
+        Passed on to the FaceOrienter constructor (e.g. `max_detection_side`)
+
+    Yields
+    ------
+    dict
+        The result of each image (see `_process_image`)
+    """
+    workers = workers or cpu_count()
+    max_in_flight = max_in_flight or 4 * workers
+
+    processed = _read_checkpoint(results_path) if resume and results_path else set()
+    results_file = open(results_path, 'a' if resume else 'w') if results_path else None
+
+    # Use the configured start method, or the platform's default, without fixing it for the whole process (so that
+    # callers can still set it later)
+    context = get_context(get_start_method(allow_none=True) or get_all_start_methods()[0])
+
+    # Load the models before forking, so that the workers share them (instead of each loading its own copy)
+    if context.get_start_method() == 'fork':
+        models.warmup()
+
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context) as executor:
+            in_flight = set()
+            images = iter(images)
+            exhausted = False
+
+            while not exhausted or in_flight:
+                # Top up the window of in-flight images
+                while not exhausted and len(in_flight) < max_in_flight:
+                    try:
+                        path, relative_path = next(images)
+                    except StopIteration:
+                        exhausted = True
+                        break
+
+                    if path in processed:
+                        continue
+                    in_flight.add(executor.submit(_process_image, path, output_dir or None, relative_path, lossless,
+                                                  kwargs))
+
+                if not in_flight:
+                    break
+
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if results_file is not None:
+                        results_file.write(json.dumps(result) + '\n')
+                        results_file.flush()
+                    yield result
+    finally:
+        if results_file is not None:
+            results_file.close()
+
+
+def main(argv=None):
+    parser = ArgumentParser(prog='python -m faceorienter',
+                            description='Predicts (and fixes) the orientation of many images in parallel.')
+    parser.add_argument('source', type=str,
+                        help='A directory (processed recursively), a glob pattern (e.g. "photos/**/*.jpg") or a JSONL '
+                             'manifest (lines are JSON objects with a "path" key, or JSON strings)')
+    parser.add_argument('-o', '--output-dir', type=str, required=False, default=None,
+                        help='Directory to which fixed images are written (keeping their relative paths)')
+    parser.add_argument('-r', '--results', type=str, required=False, default=None,
+                        help='JSONL file to which results are written incrementally (also used as checkpoint)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip images that are listed in the results file already (e.g. after a crash)')
+    parser.add_argument('-w', '--workers', type=int, required=False, default=None,
+                        help='Number of worker processes (defaults to the number of CPUs)')
+    parser.add_argument('--max-in-flight', type=int, required=False, default=None,
+                        help='Maximum number of images processed at once (defaults to 4 times the number of workers)')
+    parser.add_argument('--max-detection-side', type=int, required=False, default=None,
+                        help='Detect faces on images downscaled to this maximum side length')
+    parser.add_argument('--detection-strategy', type=str, required=False, default='first', choices=('first', 'best'),
+                        help='Stop at the first orientation with a face, or try all orientations')
+    parser.add_argument('--trust-exif', action='store_true',
+                        help='Trust EXIF orientation tags of JPEGs (skips face detection for tagged images)')
+    parser.add_argument('--escalation-threshold', type=float, required=False, default=None,
+                        help='Detect faces again on upsampled images if the confidence is below this threshold')
+    parser.add_argument('--memory-budget', type=int, required=False, default=None,
+                        help='Process images in low-memory mode, limiting the working memory of detection to this many '
+                             'bytes per image (the peak memory is reported in the results)')
+    parser.add_argument('--lossless', action='store_true',
+                        help='Rotate JPEGs losslessly, if possible (requires jpegtran)')
+    args = parser.parse_args(argv)
+
+    if args.resume and not args.results:
+        parser.error('--resume requires --results')
+
+    results = process_images(iter_images(args.source), output_dir=args.output_dir, results_path=args.results,
+                             resume=args.resume, workers=args.workers, max_in_flight=args.max_in_flight,
+                             lossless=args.lossless, max_detection_side=args.max_detection_side,
+                             detection_strategy=args.detection_strategy, trust_exif=args.trust_exif,
+                             escalation_threshold=args.escalation_threshold, memory_budget=args.memory_budget,
+                             trace_memory=args.memory_budget is not None)
+
+    n_processed, n_errors = 0, 0
+    for result in results:
+        n_processed += 1
+        n_errors += 'error' in result
+        if n_processed % 100 == 0:
+            print('processed %d images (%d errors)' % (n_processed, n_errors))
+
+    print('processed %d images (%d errors)' % (n_processed, n_errors))
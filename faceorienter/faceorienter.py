@@ -1,68 +1,733 @@
 import os
+from contextlib import contextmanager
 
 import cv2
-import dlib
 import numpy as np
-from random import randint
 
-from . import utils
+from . import metrics, models, utils
+from .rotation_order import DEFAULT_ORDER, apply_hint
 
-# Load models at module-level, so that they will be loaded only once, upon module import
-FACE_DETECTOR = dlib.get_frontal_face_detector()
-LANDMARK_DETECTOR = dlib.shape_predictor(
-    os.path.join(os.path.dirname(__file__), 'model', 'shape_predictor_5_face_landmarks.dat')
-)
+# The models are loaded only once, upon first use (see `models.warmup` to load them upfront)
+FACE_DETECTOR = models.LazyModel(models.get_face_detector)
+LANDMARK_DETECTOR = models.LazyModel(models.get_landmark_detector)
+
+ORIENTATIONS = np.array(['down', 'right', 'up', 'left'])
+
+# Detector score at which the score-based part of the confidence reaches ~63% (see `vote_orientation`)
+CONFIDENCE_SCORE_SCALE = 0.5
+
+# Upsampling used for detection if the confidence is below the escalation threshold (see `FaceOrienter`)
+ESCALATION_UPSAMPLE = 2
+
+# Maximum number of pixels of the image used for escalation (before upsampling, larger images are downscaled first).
+# Upsampling multiplies the number of pixels by 16, so this bounds the detector's working memory (~130 MB, see
+# `DETECTOR_BYTES_PER_PIXEL`) regardless of the image's size
+ESCALATION_MAX_PIXELS = 1000 * 1000
+
+# Estimated working memory (in bytes) per pixel of the detection image in low-memory mode (see `FaceOrienter`): the
+# detector's image pyramid and HOG features (measured as ~8 bytes without upsampling, quadrupling with each upsampling),
+# plus the grayscale image and one rotated copy of it
+DETECTOR_BYTES_PER_PIXEL = 8
+GRAYSCALE_BYTES_PER_PIXEL = 2
+
+
+def predict_orientations_from_landmarks(landmarks, n_rotations):
+    """
+    Predicts the orientations of many faces at once from their landmarks (see `FaceOrienter.predict_orientation` for
+    details on how the orientation is predicted).
+
+    Parameters
+    ----------
+    landmarks : numpy.ndarray
+        The facial landmarks of N faces (shape: (N, 5, 2))
+    n_rotations : numpy.ndarray | int
+        The number of rotations that were performed to find each face (shape: (N,))
+
+    Returns
+    -------
+    numpy.ndarray
+        The predicted orientations (up/down/right/left) of all faces (shape: (N,))
+    """
+    landmarks = np.asarray(landmarks)
+
+    # Get eye and nose points (as (N, 2) arrays)
+    eye_l_center = landmarks[:, 0]
+    eye_r_center = landmarks[:, 2]
+    nose_point = landmarks[:, 4]
+
+    # Predict orientation
+    nose_between_eyes = (eye_l_center[:, 0] >= nose_point[:, 0]) & (nose_point[:, 0] >= eye_r_center[:, 0])
+    nose_below_eyes = nose_point[:, 1] >= (eye_l_center[:, 1] + eye_r_center[:, 1]) / 2
+    nose_right_of_eyes = nose_point[:, 0] >= (eye_l_center[:, 0] + eye_r_center[:, 0]) / 2
+    orientation = np.where(nose_between_eyes, np.where(nose_below_eyes, 0, 2), np.where(nose_right_of_eyes, 3, 1))
+
+    # Take the added rotations into account
+    return ORIENTATIONS[(np.asarray(n_rotations) + orientation) % 4]
+
+
+def vote_orientation(landmarks, n_rotations, scores):
+    """
+    Predicts the orientation of an image from all faces found in it: each face votes for its orientation, weighted by
+    its detector score.
+
+    The confidence is the share of the votes of the winning orientation, multiplied by `1 - exp(-score / scale)` (where
+    `score` is the highest detector score of the faces voting for it, and `scale` is `CONFIDENCE_SCORE_SCALE`), i.e.
+    it is low if faces disagree or were hardly detected.
+
+    Parameters
+    ----------
+    landmarks : numpy.ndarray
+        The facial landmarks of N faces (shape: (N, 5, 2))
+    n_rotations : numpy.ndarray | int
+        The number of rotations that were performed to find each face (shape: (N,))
+    scores : numpy.ndarray
+        The detector scores of all faces (shape: (N,))
+
+    Returns
+    -------
+        orientation : str | None
+            The predicted orientation (up/down/right/left), or None if there are no faces
+        confidence : float
+            The confidence of the prediction (between 0 and 1)
+    """
+    if len(landmarks) == 0:
+        return None, 0.
+
+    orientations = predict_orientations_from_landmarks(landmarks, n_rotations)
+    weights = np.maximum(np.asarray(scores, dtype=float), 0) + 1e-6
+    votes = np.array([weights[orientations == orientation].sum() for orientation in ORIENTATIONS])
+
+    winner = int(np.argmax(votes))
+    best_score = np.max(np.asarray(scores, dtype=float)[orientations == ORIENTATIONS[winner]])
+    confidence = votes[winner] / votes.sum() * (1 - np.exp(-max(best_score, 0) / CONFIDENCE_SCORE_SCALE))
+
+    return str(ORIENTATIONS[winner]), float(confidence)
 
 
 class FaceOrienter(object):
-    def __init__(self, image_path):
+    def __init__(self, image_path, max_detection_side=None, detection_strategy='first', trust_exif=False,
+                 cache=None, rotation_order=None, orientation_hint=None, escalation_threshold=None, roi=None,
+                 roi_padding=0.5, memory_budget=None, trace_memory=False):
+        """
+        Parameters
+        ----------
+        image_path : str
+            Path to the image
+        max_detection_side : int | None
+            If set, faces and landmarks are detected on a copy of the image that is downscaled so that its longest side
+            is at most `max_detection_side` pixels (landmarks are mapped back to the original resolution). This is
+            considerably faster for large images. JPEG images are decoded directly at a reduced resolution for this.
+            If None, the full resolution is used.
+        detection_strategy : str
+            `first`: Try to detect faces in the original orientation first, then keep rotating the image by 90 degrees
+            until a face is found (fast for correctly oriented images). `best`: Detect faces in all four orientations
+            and keep the orientation with the highest detector score (more stable results, and faster for images
+            without faces, but slower for images with faces).
+        trust_exif : bool
+            If True, JPEG images whose EXIF orientation tag states that they have been rotated (i.e. values 3, 6 and 8)
+            are trusted to be oriented correctly once the tag is applied (which the decoder does), so no faces are
+            detected at all. The image is then only decoded if the fixed image is requested.
+        cache : faceorienter.cache.PredictionCache | None
+            If set, predictions are looked up in (and stored to) this cache, keyed by a hash of the encoded image. Not
+            used for images created using `from_array`.
+        rotation_order : faceorienter.rotation_order.RotationOrderScheduler | None
+            If set, the `first` detection strategy tries the orientations in the order determined by this scheduler
+            (which learns which orientations are the most frequent), instead of always starting with the original
+            orientation (see `orientation_hint` for how this affects the prediction). Can be shared by many FaceOrienter
+            instances.
+        orientation_hint : str | None
+            The expected orientation (up/down/right/left) of the image (e.g. as supplied by a client), which is tried
+            first by the `first` detection strategy. Since only the original orientation is upsampled (regardless of the
+            order), the prediction only differs from the default order if faces are detected in several orientations.
+        escalation_threshold : float | None
+            If set, and the confidence of the prediction (see `predict_orientation_with_confidence`) is below this
+            threshold (e.g. because no face was found), faces are detected again in all four orientations on an
+            upsampled image, which finds smaller faces but is considerably slower. So the additional effort is only
+            spent on hard images. Images larger than `ESCALATION_MAX_PIXELS` are downscaled before upsampling.
+        roi : tuple | list | numpy.ndarray | None
+            A region of interest (left, top, right, bottom) in the original image's coordinates, where a face is
+            expected (e.g. the face's bounding box found by a previous call, see `get_original_face_rect`, or a crop
+            supplied by a client). Faces are searched for in this region (padded by `roi_padding`) first, which is much
+            faster for large images in which the face covers only a small part. The whole image is searched only if no
+            face is found in the region (see `roi_hit`).
+        roi_padding : float
+            Padding added to each side of the region of interest, relative to its longest side
+        memory_budget : int | None
+            If set, the image is processed in a low-memory mode, for very large images: the resolution used for
+            detection is limited (in addition to `max_detection_side`) so that the estimated working memory of detection
+            stays within this budget (in bytes, see `DETECTOR_BYTES_PER_PIXEL`). JPEGs are decoded directly at a reduced
+            resolution, other formats are decoded in grayscale (rather than in color) for detection. The decoded image
+            is not kept, but decoded again when the fixed image is requested (and released right after). Note that
+            formats other than JPEG can't be decoded at a reduced resolution, and that fixing the orientation requires
+            the full-resolution image (and a rotated copy for quarter turns), unless it is rotated losslessly.
+        trace_memory : bool
+            If True, the peak memory used for detection and fixing is measured using `tracemalloc` (see `peak_memory`
+            and `metrics.trace_memory`). Tracing slows down allocations in all threads of the process, and concurrent
+            measurements include each other's allocations, so it should only be used in single-threaded processes (e.g.
+            the command line tool's worker processes), not in the server.
+        """
         if not os.path.isfile(image_path):
             raise FileNotFoundError('File `%s` was not found.' % str(image_path))
 
-        self.img = cv2.imread(image_path)
-        self.landmarks, self.n_rotations = self.__detect_faces()
+        with metrics.timed('read'), open(image_path, 'rb') as image_file:
+            image_bytes = image_file.read()
+
+        self.__setup(None, image_bytes, max_detection_side, detection_strategy, trust_exif, cache, rotation_order,
+                     orientation_hint, escalation_threshold, roi, roi_padding, memory_budget, trace_memory)
+
+    @classmethod
+    def from_bytes(cls, image_bytes, **kwargs):
+        """
+        Creates a FaceOrienter from an encoded image (e.g. the raw contents of a JPEG or PNG file), without touching the
+        file system.
+
+        Parameters
+        ----------
+        image_bytes : bytes | bytearray | memoryview
+            The encoded image
+        kwargs
+            Passed on to the constructor (e.g. `max_detection_side`)
+
+        Returns
+        -------
+        FaceOrienter
+        """
+        face_orienter = cls.__new__(cls)
+        face_orienter.__setup(None, image_bytes, **kwargs)
+
+        return face_orienter
+
+    @classmethod
+    def from_array(cls, img, **kwargs):
+        """
+        Creates a FaceOrienter from an already decoded image.
+
+        Parameters
+        ----------
+        img : numpy.ndarray
+            The image as BGR array (as returned by `cv2.imread`/`cv2.imdecode`)
+        kwargs
+            Passed on to the constructor (e.g. `max_detection_side`)
+
+        Returns
+        -------
+        FaceOrienter
+        """
+        face_orienter = cls.__new__(cls)
+        face_orienter.__setup(img, None, **kwargs)
+
+        return face_orienter
+
+    def __setup(self, img, image_bytes, max_detection_side=None, detection_strategy='first', trust_exif=False,
+                cache=None, rotation_order=None, orientation_hint=None, escalation_threshold=None, roi=None,
+                roi_padding=0.5, memory_budget=None, trace_memory=False):
+        if detection_strategy not in ('first', 'best'):
+            raise ValueError('Unknown detection strategy `%s`.' % str(detection_strategy))
+        if orientation_hint is not None and orientation_hint not in ORIENTATIONS:
+            raise ValueError('Unknown orientation hint `%s`.' % str(orientation_hint))
+
+        self.__img = img
+        self.__image_bytes = image_bytes
+        self.max_detection_side = max_detection_side
+        self.detection_strategy = detection_strategy
+        self.rotation_order = rotation_order
+        self.orientation_hint = orientation_hint
+        self.escalation_threshold = escalation_threshold
+        self.roi = np.array(roi, dtype=float) if roi is not None else None
+        self.roi_padding = roi_padding
+        self.roi_hit = None  # Whether a face was found in the region of interest (None if there is none)
+        self.memory_budget = memory_budget
+        self.trace_memory = trace_memory
+        self.peak_memory = None  # The peak memory (in bytes) used for detection and fixing (if `trace_memory` is set)
+        self.exif_orientation = utils.read_jpeg_orientation(image_bytes) if image_bytes is not None else None
+        self.__order = self.__get_order() if detection_strategy == 'first' else None
+        metrics.increment('images')
+
+        cache_key = None
+        if cache is not None and image_bytes is not None:
+            # All options that affect the prediction
+            cache_key = cache.make_key(image_bytes, '|%s|%s|%s|%s|%s|%s|%s|%s' % (
+                max_detection_side, detection_strategy, trust_exif, escalation_threshold,
+                None if roi is None else ','.join(repr(float(v)) for v in roi), roi_padding, memory_budget,
+                None if self.__order is None else ''.join(str(n) for n in self.__order)))
+            cached = cache.get(cache_key)
+            if cached is not None and 'confidence' in cached:
+                self.landmarks = np.array(cached['landmarks']) if cached['landmarks'] is not None else None
+                self.face_rect = np.array(cached['face_rect']) if cached.get('face_rect') is not None else None
+                self.all_landmarks = np.array(cached['all_landmarks'], dtype=int).reshape(-1, 5, 2)
+                self.face_scores = np.array(cached['face_scores'], dtype=float)
+                self.n_rotations = cached['n_rotations']
+                self.roi_hit = cached.get('roi_hit')
+                self.__predicted_orientation, self.confidence = cached['orientation'], cached['confidence']
+                return
+
+        if trust_exif and self.exif_orientation in (3, 6, 8):
+            # The decoder applies the EXIF orientation, so the decoded image will be oriented correctly
+            self.all_landmarks, self.face_scores, self.face_rect, self.n_rotations = \
+                np.zeros((0, 5, 2), dtype=int), np.zeros(0), None, 0
+            self.__predicted_orientation, self.confidence = 'down', 1.
+            metrics.increment('exif_trusted')
+        else:
+            with self.__trace_memory():
+                self.all_landmarks, face_rects, self.face_scores, self.n_rotations = self.__detect_faces()
+            self.face_rect = face_rects[0] if len(face_rects) > 0 else None
+            self.__predicted_orientation, self.confidence = vote_orientation(self.all_landmarks, self.n_rotations,
+                                                                             self.face_scores)
+            if self.__predicted_orientation is None:
+                metrics.increment('no_face')
+
+        # The landmarks of the face with the highest detector score
+        self.landmarks = self.all_landmarks[0] if len(self.all_landmarks) > 0 else None
+
+        if cache_key is not None:
+            cache.set(cache_key, {
+                'orientation': self.__predicted_orientation,
+                'confidence': self.confidence,
+                'landmarks': self.landmarks.tolist() if self.landmarks is not None else None,
+                'all_landmarks': self.all_landmarks.tolist(),
+                'face_rect': self.face_rect.tolist() if self.face_rect is not None else None,
+                'face_scores': self.face_scores.tolist(),
+                'n_rotations': self.n_rotations,
+                'roi_hit': self.roi_hit,
+            })
 
-        self.__predicted_orientation = None
+    @property
+    def img(self):
+        """
+        The image as BGR array (if the FaceOrienter was created from an encoded image, it is decoded upon first access,
+        or upon each access in low-memory mode, see `memory_budget`)
+        """
+        if self.__img is not None:
+            return self.__img
+
+        with metrics.timed('decode'):
+            img = cv2.imdecode(np.frombuffer(self.__image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if self.memory_budget is None:
+            self.__img = img
+
+        return img
+
+    @property
+    def image_size(self):
+        """
+        The image's (width, height). If the image hasn't been decoded yet, the size is read from the JPEG/PNG header (if
+        possible), so that the image doesn't have to be decoded.
+        """
+        if self.__img is None and self.__image_bytes is not None:
+            size = utils.read_image_size(self.__image_bytes)
+            if size is not None:
+                # The decoder applies the EXIF orientation, which swaps width and height for orientations 5-8
+                return (size[1], size[0]) if self.exif_orientation in (5, 6, 7, 8) else size
+
+        return self.img.shape[1], self.img.shape[0]
+
+    def get_original_landmarks(self):
+        """
+        The landmarks (`self.landmarks`) are located in the image as rotated during face detection (see
+        `self.n_rotations`). This maps them back to the original image.
+
+        Returns
+        -------
+        numpy.ndarray | None
+            The landmark coordinates in the original image (or None if no landmarks could be found)
+        """
+        if self.landmarks is None:
+            return None
+
+        return utils.unrotate_points(self.landmarks, self.n_rotations, self.image_size)
+
+    def get_original_face_rect(self):
+        """
+        The face's bounding box (`self.face_rect`) is located in the image as rotated during face detection (see
+        `self.n_rotations`). This maps it back to the original image.
+
+        Returns
+        -------
+        numpy.ndarray | None
+            The face's bounding box in the original image as (left, top, right, bottom) (or None if no face was found)
+        """
+        if self.face_rect is None:
+            return None
+
+        corners = utils.unrotate_points(self.face_rect.reshape(2, 2), self.n_rotations, self.image_size)
+        return np.concatenate([corners.min(axis=0), corners.max(axis=0)])
 
     def __detect_faces(self):
         """
-        Checks if the supplied image contains a face. If it doesn't, the image will repeatedly be rotated by 90 degrees
-        to check for faces again.
+        Checks if the supplied image contains faces. If it doesn't, the image will repeatedly be rotated by 90 degrees
+        to check for faces again (or, using the `best` detection strategy, all orientations are checked, and the one
+        with the highest detector score is kept).
+
+        If faces were found, we will then try to find their facial landmarks (eye boundaries and nose tip).
+
+        If `max_detection_side` is set, detection runs on a downscaled copy of the image (JPEGs are decoded directly at
+        a reduced resolution), and the landmarks are scaled back to the original resolution. In low-memory mode, the
+        copy's resolution is limited by the memory budget, too (see `__get_max_detection_side`).
+
+        If a region of interest is set (`roi`), faces are searched for in that region first, and the whole image is only
+        searched if no face is found there.
+
+        If `escalation_threshold` is set and the confidence of the resulting prediction is below it, faces are detected
+        again in all orientations on an upsampled image (downscaled to `ESCALATION_MAX_PIXELS` first, if necessary), and
+        the result with the higher confidence is kept.
+
+        Returns
+        -------
+            landmarks : numpy.ndarray
+                The facial landmark coordinates of all faces, sorted by detector score (shape: (N, 5, 2))
+            face_rects : numpy.ndarray
+                The faces' bounding boxes as (left, top, right, bottom) (shape: (N, 4))
+            scores : numpy.ndarray
+                The faces' detector scores (shape: (N,))
+            n_rotations : int
+                The number of rotations performed
+        """
+        # The size of encoded images is read from their header, if possible (otherwise, it's known once decoded)
+        size = utils.read_image_size(self.__image_bytes) if self.__image_bytes is not None else self.image_size
+        max_side = self.__get_max_detection_side(size) if size is not None else self.max_detection_side
+
+        # Decode JPEGs directly at a reduced resolution, if possible. Otherwise, convert the full image to grayscale (in
+        # low-memory mode, the image is decoded in grayscale directly, and not kept)
+        reduced = None
+        if max_side and self.__image_bytes is not None:
+            with metrics.timed('decode_reduced'):
+                reduced = utils.decode_reduced_grayscale(self.__image_bytes, max_side)
+
+        if reduced is not None:
+            img_gray, scale = reduced
+        elif self.memory_budget is not None and self.__img is None:
+            with metrics.timed('decode'):
+                img_gray, scale = cv2.imdecode(np.frombuffer(self.__image_bytes, dtype=np.uint8),
+                                               cv2.IMREAD_GRAYSCALE), 1.
+            if img_gray is None:
+                raise cv2.error('Image could not be decoded.')
+        else:
+            img = self.img
+            with metrics.timed('grayscale'):
+                img_gray, scale = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), 1.
+
+        if size is None:
+            max_side = self.__get_max_detection_side((img_gray.shape[1], img_gray.shape[0]))
+
+        # Downscale, if the image (still) exceeds the maximum detection size (the full-size image is released then)
+        if max_side:
+            with metrics.timed('downscale'):
+                img_gray, downscale = utils.downscale_image(img_gray, max_side)
+            scale *= downscale
+
+        landmarks, n_passes = None, 0
+        if self.roi is not None:
+            roi_result, n_passes = self.__find_faces_in_roi(img_gray, scale)
+            self.roi_hit = roi_result is not None
+            metrics.increment('roi_hits' if self.roi_hit else 'roi_misses')
+            if self.roi_hit:
+                landmarks, face_rects, scores, n_rotations = roi_result
+
+        if landmarks is None:
+            img_rotated, face_rects, scores, n_rotations, n_image_passes = self.__find_faces(img_gray)
+            landmarks, face_rects, scores = self.__find_landmarks(img_rotated, face_rects, scores)
+            n_passes += n_image_passes
+
+        if self.rotation_order is not None and self.detection_strategy == 'first':
+            self.rotation_order.update(n_rotations if len(landmarks) > 0 else None, n_passes, self.exif_orientation)
+
+        # Spend more effort on images whose prediction is uncertain
+        if self.escalation_threshold is not None:
+            confidence = vote_orientation(landmarks, n_rotations, scores)[1]
+            if confidence < self.escalation_threshold:
+                metrics.increment('escalations')
+                img_escalation, escalation_scale = img_gray, 1.
+                if img_gray.size > ESCALATION_MAX_PIXELS:
+                    with metrics.timed('downscale'):
+                        img_escalation, escalation_scale = utils.downscale_image(
+                            img_gray, int(max(img_gray.shape) * np.sqrt(ESCALATION_MAX_PIXELS / float(img_gray.size))))
+
+                img_rotated, escalated_face_rects, escalated_scores, escalated_n_rotations = \
+                    self.__find_best_faces(img_escalation, ESCALATION_UPSAMPLE)
+                escalated_landmarks, escalated_face_rects, escalated_scores = \
+                    self.__find_landmarks(img_rotated, escalated_face_rects, escalated_scores)
+                if vote_orientation(escalated_landmarks, escalated_n_rotations, escalated_scores)[1] > confidence:
+                    landmarks, face_rects, scores, n_rotations = \
+                        escalated_landmarks, escalated_face_rects, escalated_scores, escalated_n_rotations
+                    if escalation_scale != 1.:
+                        landmarks = np.round(landmarks / escalation_scale).astype(landmarks.dtype)
+                        face_rects = np.round(face_rects / escalation_scale).astype(face_rects.dtype)
+
+        # Map the landmarks back to the original resolution
+        if scale != 1.:
+            landmarks = np.round(landmarks / scale).astype(landmarks.dtype)
+            face_rects = np.round(face_rects / scale).astype(face_rects.dtype)
+
+        return landmarks, face_rects, scores, n_rotations
+
+    def __get_max_detection_side(self, size):
+        """
+        Parameters
+        ----------
+        size : (int, int)
+            The image's (width, height)
+
+        Returns
+        -------
+        int | None
+            The maximum side length of the image used for detection: `max_detection_side`, further limited in low-memory
+            mode so that the estimated working memory of detection (at the highest upsampling used) fits into the budget
+        """
+        if self.memory_budget is None:
+            return self.max_detection_side
 
-        If a face was found, we will then try to find facial landmarks (eye boundaries and nose tip).
+        if self.escalation_threshold is not None:
+            upsample = ESCALATION_UPSAMPLE
+        else:
+            upsample = 1 if self.detection_strategy == 'first' else 0
+        max_pixels = self.memory_budget / float(GRAYSCALE_BYTES_PER_PIXEL + DETECTOR_BYTES_PER_PIXEL * 4 ** upsample)
+
+        width, height = size
+        max_side = max(int(max(width, height) * min(np.sqrt(max_pixels / (width * height)), 1.)), 1)
+        return min(max_side, self.max_detection_side or max_side)
+
+    @contextmanager
+    def __trace_memory(self):
+        """
+        Context manager measuring the peak memory used within its body if `trace_memory` is set (see
+        `metrics.trace_memory`), which updates `peak_memory`
+        """
+        if not self.trace_memory:
+            yield
+            return
+
+        with metrics.trace_memory() as trace:
+            yield
+        self.peak_memory = max(self.peak_memory or 0, trace['peak'])
+
+    def __find_faces(self, img_gray):
+        """
+        Detects faces using the configured detection strategy (see `__find_first_faces` and `__find_best_faces`).
+
+        Parameters
+        ----------
+        img_gray : numpy.ndarray
+            The grayscale image
 
         Returns
         -------
-            landmarks : numpy.ndarray | None
-                The facial landmark coordinates (or None if no face/landmarks could be found)
+            img_gray : numpy.ndarray
+                The grayscale image, rotated into the orientation in which faces were found
+            face_rects : list
+                The detected faces (dlib rectangles), sorted by detector score (empty if none were found)
+            scores : list
+                The faces' detector scores
             n_rotations : int
                 The number of rotations performed
+            n_passes : int
+                The number of detector passes performed
+        """
+        if self.detection_strategy == 'best':
+            return self.__find_best_faces(img_gray) + (4,)
+
+        return self.__find_first_faces(img_gray, self.__order)
+
+    def __get_order(self):
+        """
+        Returns
+        -------
+        list
+            The numbers of rotations (0-3) in the order in which they are tried by the `first` detection strategy (see
+            `rotation_order` and `orientation_hint`)
+        """
+        # A face is found after n rotations if the image's orientation is ORIENTATIONS[n]
+        hint = ORIENTATIONS.tolist().index(self.orientation_hint) if self.orientation_hint else None
+        if self.rotation_order is not None:
+            return self.rotation_order.get_order(self.exif_orientation, hint)
+
+        return apply_hint(DEFAULT_ORDER, hint)
+
+    def __find_faces_in_roi(self, img_gray, scale):
         """
-        # Convert to grayscale
-        img_gray = cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY)
+        Detects faces (and their landmarks) in the padded region of interest only. Rotating the region in order to
+        find faces in other orientations is much cheaper than rotating the whole image, too.
 
-        n_rotations = 0
-        face_rects = FACE_DETECTOR(img_gray, 1)
+        Parameters
+        ----------
+        img_gray : numpy.ndarray
+            The grayscale image
+        scale : float
+            The scale of `img_gray` relative to the original image
+
+        Returns
+        -------
+            result : (numpy.ndarray, numpy.ndarray, numpy.ndarray, int) | None
+                The landmarks, bounding boxes and scores of the faces found, in the coordinates of the whole (rotated)
+                `img_gray` (see `__detect_faces`), and the number of rotations performed (None if no face was found)
+            n_passes : int
+                The number of detector passes performed
+        """
+        left, top, right, bottom = self.roi * scale
+        padding = self.roi_padding * max(right - left, bottom - top)
+        left, top = int(max(left - padding, 0)), int(max(top - padding, 0))
+        right, bottom = int(min(right + padding, img_gray.shape[1])), int(min(bottom + padding, img_gray.shape[0]))
+        if right - left < 2 or bottom - top < 2:
+            return None, 0
 
-        # If no faces are detected, rotate the image by 90 degrees and try again
+        img_roi = np.ascontiguousarray(img_gray[top:bottom, left:right])  # dlib requires contiguous images
+        img_rotated, face_rects, scores, n_rotations, n_passes = self.__find_faces(img_roi)
         if len(face_rects) == 0:
-            for n_rotations in range(1, 4):
-                img_gray = utils.rotate_image(img_gray, 90)
-                face_rects = FACE_DETECTOR(img_gray)
-                if len(face_rects) > 0:
-                    break
+            return None, n_passes
+        landmarks, face_rects, scores = self.__find_landmarks(img_rotated, face_rects, scores)
+
+        # Map the coordinates from the rotated region to the rotated image: rotate them back, shift them by the region's
+        # offset, and rotate them into the rotated image
+        def to_image(points):
+            points = utils.unrotate_points(points, n_rotations, (right - left, bottom - top)) + [left, top]
+            return utils.rotate_points(points, n_rotations, (img_gray.shape[1], img_gray.shape[0]))
+
+        landmarks = to_image(landmarks.reshape(-1, 2)).reshape(-1, 5, 2)
+        corners = to_image(face_rects.reshape(-1, 2)).reshape(-1, 2, 2)
+        face_rects = np.concatenate([corners.min(axis=1), corners.max(axis=1)], axis=1)
+
+        return (landmarks, face_rects, scores, n_rotations), n_passes
+
+    @staticmethod
+    def __find_landmarks(img_gray, face_rects, scores):
+        """
+        Finds the facial landmarks of all faces.
+
+        Parameters
+        ----------
+        img_gray : numpy.ndarray
+            The grayscale image, rotated into the orientation in which the faces were found
+        face_rects : list
+            The detected faces (dlib rectangles), sorted by detector score
+        scores : list
+            The faces' detector scores
+
+        Returns
+        -------
+            landmarks : numpy.ndarray
+                The facial landmark coordinates of all faces (shape: (N, 5, 2))
+            face_rects : numpy.ndarray
+                The faces' bounding boxes as (left, top, right, bottom) (shape: (N, 4))
+            scores : numpy.ndarray
+                The faces' detector scores (shape: (N,))
+        """
+        with metrics.timed('landmarks'):
+            landmarks = np.array([utils.dlib_shape_to_np_array(LANDMARK_DETECTOR(img_gray, face_rect))
+                                  for face_rect in face_rects], dtype=int).reshape(-1, 5, 2)
+        face_rects = np.array([[face_rect.left(), face_rect.top(), face_rect.right(), face_rect.bottom()]
+                               for face_rect in face_rects], dtype=int).reshape(-1, 4)
+
+        return landmarks, face_rects, np.array(scores, dtype=float)
+
+    @staticmethod
+    def __find_first_faces(img_gray, order=DEFAULT_ORDER):
+        """
+        Tries to detect faces in the orientations given by `order` (by default, the original orientation first, then
+        rotating the image by 90 degrees at a time), until faces are found (or all orientations were tried). Only the
+        original orientation is upsampled (wherever it is in the order), so that the order doesn't change which faces
+        can be found in each orientation.
+
+        Parameters
+        ----------
+        img_gray : numpy.ndarray
+            The grayscale image
+        order : list | tuple
+            The numbers of clockwise 90 degree rotations (0-3) in the order in which they should be tried
+
+        Returns
+        -------
+            img_gray : numpy.ndarray
+                The grayscale image, rotated into the orientation in which faces were found
+            face_rects : list
+                The detected faces (dlib rectangles), sorted by detector score (empty if none were found)
+            scores : list
+                The faces' detector scores
+            n_rotations : int
+                The number of rotations performed
+            n_passes : int
+                The number of detector passes performed
+        """
+        img_rotated, face_rects, scores, n_rotations, n_passes = img_gray, [], [], 0, 0
+
+        for n_passes, n_rotations in enumerate(order, 1):
+            if n_rotations > 0:
+                metrics.increment('rotation_attempts')
+                with metrics.timed('rotate'):
+                    # dlib requires contiguous images
+                    img_rotated = utils.rotate_image(img_gray, n_rotations * 90, contiguous=True)
+            else:
+                img_rotated = img_gray
+            with metrics.timed('detect'):
+                face_rects, scores, _ = FACE_DETECTOR.run(img_rotated, 1 if n_rotations == 0 else 0)
+            if len(face_rects) > 0:
+                break
 
-        # Find landmarks
-        landmarks = None
-        if len(face_rects) > 0:
-            landmarks = utils.dlib_shape_to_np_array(LANDMARK_DETECTOR(img_gray, face_rects[0]))
+        order = np.argsort(scores)[::-1]
+        return img_rotated, [face_rects[i] for i in order], [scores[i] for i in order], n_rotations, n_passes
 
-        return landmarks, n_rotations
+    @staticmethod
+    def __find_best_faces(img_gray, upsample=0):
+        """
+        Detects faces in all four orientations and picks the orientation with the highest detector score. Each
+        orientation is rotated directly from the original grayscale image (dlib requires contiguous images, so a
+        transposed/flipped view can't be passed on directly). All orientations are upsampled equally (by default, not
+        at all), so that their detector scores are comparable.
+
+        Parameters
+        ----------
+        img_gray : numpy.ndarray
+            The grayscale image
+        upsample : int
+            The number of times the image is upsampled (which finds smaller faces, but is slower)
+
+        Returns
+        -------
+            img_gray : numpy.ndarray
+                The grayscale image, rotated into the orientation with the highest detector score
+            face_rects : list
+                The detected faces (dlib rectangles), sorted by detector score (empty if none were found)
+            scores : list
+                The faces' detector scores
+            n_rotations : int
+                The number of rotations performed
+        """
+        best_img_gray, best_face_rects, best_scores, best_n_rotations = img_gray, [], [], 0
+
+        for n_rotations in range(0, 4):
+            if n_rotations > 0:
+                metrics.increment('rotation_attempts')
+            with metrics.timed('rotate'):
+                img_rotated = utils.rotate_image(img_gray, n_rotations * 90, contiguous=True)
+            with metrics.timed('detect'):
+                face_rects, scores, _ = FACE_DETECTOR.run(img_rotated, upsample)
+            if len(face_rects) == 0:
+                continue
+
+            order = np.argsort(scores)[::-1]
+            if len(best_scores) == 0 or scores[order[0]] > best_scores[0]:
+                best_img_gray, best_n_rotations = img_rotated, n_rotations
+                best_face_rects, best_scores = [face_rects[i] for i in order], [scores[i] for i in order]
+
+        return best_img_gray, best_face_rects, best_scores, best_n_rotations
+
+    def predict_orientation_with_confidence(self):
+        """
+        Predicts the orientation from the landmarks of all faces found in the image (each face votes for its orientation
+        weighted by its detector score, see `vote_orientation`), along with the confidence of the prediction.
+
+        Returns
+        -------
+            orientation : str | None
+                Predicted orientation (up/down/right/left), or None if no face was found
+            confidence : float
+                Confidence of the prediction between 0 (e.g. no face was found) and 1 (e.g. trusted EXIF orientation)
+        """
+        return self.__predicted_orientation, self.confidence
 
     def predict_orientation(self):
         """
         We're going to predict the orientation by analyzing the position of the nose relative to the eyes (while also
-        taking into account the number of rotations required for face(s) to be found)
+        taking into account the number of rotations required for face(s) to be found). If there are multiple faces,
+        they vote for the orientation (see `predict_orientation_with_confidence`).
 
         More specifically, if the nose's x-position is between the left eye's and the right eye's x-position, we can
         assume that the image is either correctly oriented, or upside down. And if in addition to that, the nose's
@@ -72,42 +737,95 @@ class FaceOrienter(object):
         Returns
         -------
             str
-                Predicted orientation (up/down/right/left)
+                Predicted orientation (up/down/right/left). If no face was found, `down` is returned (i.e. the image is
+                left as it is), use `predict_orientation_with_confidence` to tell these cases apart
+        """
+        return self.__predicted_orientation or 'down'
+
+    def __get_required_rotations(self):
+        """
+        Returns
+        -------
+        int
+            The number of clockwise 90 degree rotations required to fix the image's orientation
+        """
+        return {
+            'down': 0,
+            'right': 1,
+            'up': 2,
+            'left': 3
+        }[self.predict_orientation()]
+
+    def get_fixed_image(self):
         """
-        if self.__predicted_orientation:
-            return self.__predicted_orientation
+        Fixes the orientation of the original image and returns the result.
 
-        if self.landmarks is None:  # For now, just return a random orientation if no landmarks were found (not good)
-            return ['down', 'right', 'up', 'left'][randint(0, 3)]
+        Returns
+        -------
+        numpy.ndarray
+            The correctly oriented image
+        """
+        with self.__trace_memory():
+            img, n_rotations_required = self.img, self.__get_required_rotations()
+            with metrics.timed('rotate'):
+                if n_rotations_required == 2 and img is not self.__img:
+                    # The image was decoded for this call only (low-memory mode), so it can be rotated in place
+                    return cv2.flip(img, -1, dst=img)
+                return utils.rotate_image(img, n_rotations_required * 90, contiguous=True)
 
-        # Get eye and nose points
-        eye_l_points = self.landmarks[0:1]
-        eye_r_points = self.landmarks[2:3]
-        nose_point = self.landmarks[4]
+    def get_fixed_image_bytes(self, ext='.jpg', lossless=False, quality=None):
+        """
+        Fixes the orientation of the original image and returns the result encoded in memory.
 
-        # Calculate eye center
-        eye_l_center = eye_l_points.mean(axis=0).astype(np.int)
-        eye_r_center = eye_r_points.mean(axis=0).astype(np.int)
+        Parameters
+        ----------
+        ext : str
+            File extension determining the output format (e.g. `.jpg` or `.png`, see `cv2.imencode`)
+        lossless : bool
+            If True and both the original image and the output format are JPEG, the image is rotated without being
+            decoded and re-encoded, so there's no loss of quality (see `utils.rotate_jpeg_lossless`). Falls back to
+            re-encoding the image if that's not possible.
+        quality : int | None
+            The quality (1-100) of JPEG and WebP images (if None, OpenCV's default is used). If set, JPEGs are always
+            re-encoded (i.e. `lossless` is ignored). Ignored for other formats.
 
-        # Predict orientation
-        if eye_l_center[0] >= nose_point[0] >= eye_r_center[0]:
-            if nose_point[1] >= (eye_l_center[1] + eye_r_center[1]) / 2:
-                orientation = 0
-            else:
-                orientation = 2
-        else:
-            if nose_point[0] >= (eye_l_center[0] + eye_r_center[0]) / 2:
-                orientation = 3
-            else:
-                orientation = 1
+        Returns
+        -------
+        bytes
+            The encoded, correctly oriented image
+        """
+        with self.__trace_memory():
+            return self.__get_fixed_image_bytes(ext, lossless, quality)
 
-        # Take the added rotations into account and return the predicted orientation
-        # Also store it, so that it doesn't have to be predicted repeatedly
-        self.__predicted_orientation = ['down', 'right', 'up', 'left'][(self.n_rotations + orientation) % 4]
+    def __get_fixed_image_bytes(self, ext, lossless, quality):
+        """See `get_fixed_image_bytes`"""
+        if lossless and quality is None and self.__image_bytes is not None and ext.lower() in ('.jpg', '.jpeg') \
+                and utils.read_jpeg_size(self.__image_bytes) is not None:
+            # The stored image data doesn't have the EXIF orientation applied yet, so take it into account
+            exif_rotations = utils.EXIF_ORIENTATION_ROTATIONS.get(self.exif_orientation or 1)
+            if exif_rotations is not None:
+                angle = (exif_rotations + self.__get_required_rotations()) * 90
+                with metrics.timed('rotate_lossless'):
+                    img_fixed_bytes = utils.rotate_jpeg_lossless(self.__image_bytes, angle)
+                if img_fixed_bytes is not None:
+                    return img_fixed_bytes
 
-        return self.__predicted_orientation
+        params = []
+        if quality is not None and ext.lower() in ('.jpg', '.jpeg'):
+            params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+        elif quality is not None and ext.lower() == '.webp':
+            params = [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
 
-    def fix_orientation(self, save_path):
+        img_fixed = self.get_fixed_image()
+        with metrics.timed('encode'):
+            success, buf = cv2.imencode(ext, img_fixed, params)
+        del img_fixed  # Release the full-size image before the encoded image is copied
+        if not success:
+            raise ValueError('Image could not be encoded as `%s`.' % str(ext))
+
+        return buf.tobytes()
+
+    def fix_orientation(self, save_path, lossless=False):
         """
         Fixes the orientation of the original image and writes the resulting image to disk.
 
@@ -115,13 +833,14 @@ class FaceOrienter(object):
         ----------
         save_path : str
             Path to which the new image should be written
+        lossless : bool
+            If True, JPEG images are rotated without being re-encoded, if possible (see `get_fixed_image_bytes`)
         """
-        n_rotations_required = {
-            'down': 0,
-            'right': 1,
-            'up': 2,
-            'left': 3
-        }[self.predict_orientation()]
-
-        img_fixed = utils.rotate_image(self.img, n_rotations_required * 90)
-        cv2.imwrite(save_path, img_fixed)
+        if lossless:
+            with open(save_path, 'wb') as save_file:
+                save_file.write(self.get_fixed_image_bytes(os.path.splitext(save_path)[1], lossless=True))
+        else:
+            with self.__trace_memory():
+                img_fixed = self.get_fixed_image()
+                with metrics.timed('encode'):
+                    cv2.imwrite(save_path, img_fixed)
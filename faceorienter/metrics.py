@@ -0,0 +1,227 @@
+"""
+Optional instrumentation of the processing pipeline. Once enabled (see `enable`), the durations of all processing
+stages (decoding, grayscale conversion, detector passes, rotations, landmark detection, encoding, ...) and a few
+counters (e.g. images without faces) are recorded. They can be consumed via hooks, as a snapshot, or in the
+Prometheus text format. Instrumentation is disabled by default, so it adds virtually no overhead unless it's used.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (in seconds) of the duration histogram's buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+
+_enabled = False
+_hooks = []
+_lock = threading.Lock()
+_stages = {}  # stage -> [count, sum, bucket counts]
+_counters = {}  # counter -> value
+_n_memory_traces = 0  # Number of active `trace_memory` blocks
+_started_tracing = False  # Whether tracing was started by `trace_memory` (and has to be stopped by it)
+
+
+def enable():
+    """Enables instrumentation"""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Disables instrumentation (recorded metrics are kept, see `reset`)"""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def add_hook(hook):
+    """
+    Adds a hook, which is called for every recorded stage duration and counter increment (while instrumentation is
+    enabled). Hooks are called synchronously on the processing thread, so they should be fast.
+
+    Parameters
+    ----------
+    hook : callable
+        Called as `hook(kind, name, value)`, where `kind` is either `stage` (`value` is the duration in seconds) or
+        `counter` (`value` is the increment)
+    """
+    with _lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook):
+    with _lock:
+        _hooks.remove(hook)
+
+
+def reset():
+    """Discards all recorded metrics"""
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+@contextmanager
+def timed(stage):
+    """
+    Context manager recording the duration of a processing stage (if instrumentation is enabled).
+
+    Parameters
+    ----------
+    stage : str
+        The stage's name
+    """
+    if not _enabled:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def record(stage, duration):
+    """
+    Records the duration of a processing stage (if instrumentation is enabled).
+
+    Parameters
+    ----------
+    stage : str
+        The stage's name
+    duration : float
+        The duration in seconds
+    """
+    if not _enabled:
+        return
+
+    with _lock:
+        stats = _stages.get(stage)
+        if stats is None:
+            stats = _stages[stage] = [0, 0., [0] * len(BUCKETS)]
+        stats[0] += 1
+        stats[1] += duration
+        for i, upper_bound in enumerate(BUCKETS):
+            if duration <= upper_bound:
+                stats[2][i] += 1
+                break
+        hooks = list(_hooks)
+
+    for hook in hooks:
+        hook('stage', stage, duration)
+
+
+def increment(counter, value=1):
+    """
+    Increments a counter (if instrumentation is enabled).
+
+    Parameters
+    ----------
+    counter : str
+        The counter's name
+    value : int
+        The increment
+    """
+    if not _enabled:
+        return
+
+    with _lock:
+        _counters[counter] = _counters.get(counter, 0) + value
+        hooks = list(_hooks)
+
+    for hook in hooks:
+        hook('counter', counter, value)
+
+
+@contextmanager
+def trace_memory():
+    """
+    Context manager measuring the peak memory allocated within its body using `tracemalloc`, which covers Python objects
+    and numpy arrays (including images decoded by OpenCV), but not memory allocated internally by native libraries (such
+    as dlib's detector). Independent of `enable`: tracing is only active while such a block is executed, since it slows
+    down allocations. Blocks executed concurrently (e.g. by other threads) share the trace, so their peaks include each
+    other's allocations.
+
+    Yields
+    ------
+    dict
+        Upon exit, `peak` is set to the peak memory (in bytes) allocated on top of what was allocated upon entering
+    """
+    global _n_memory_traces, _started_tracing
+    import tracemalloc  # Imported here, since it's only available as of Python 3.4
+
+    with _lock:
+        _n_memory_traces += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        elif _n_memory_traces == 1 and hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+            tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+    trace = {}
+    try:
+        yield trace
+    finally:
+        with _lock:
+            trace['peak'] = max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+            _n_memory_traces -= 1
+            if _n_memory_traces == 0 and _started_tracing:
+                tracemalloc.stop()
+                _started_tracing = False
+
+
+def snapshot():
+    """
+    Returns
+    -------
+    dict
+        The recorded metrics: `stages` maps each stage to its `count` and total duration (`sum`, in seconds), `counters`
+        maps each counter to its value
+    """
+    with _lock:
+        return {
+            'stages': {stage: {'count': stats[0], 'sum': stats[1]} for stage, stats in _stages.items()},
+            'counters': dict(_counters),
+        }
+
+
+def to_prometheus(gauges=None):
+    """
+    Formats the recorded metrics in the Prometheus text exposition format.
+
+    Parameters
+    ----------
+    gauges : dict | None
+        Additional gauges (name -> value) to be included (e.g. the current queue depth)
+
+    Returns
+    -------
+    str
+    """
+    lines = ['# HELP faceorienter_stage_duration_seconds Duration of processing stages',
+             '# TYPE faceorienter_stage_duration_seconds histogram']
+
+    with _lock:
+        for stage, (count, total, bucket_counts) in sorted(_stages.items()):
+            cumulative = 0
+            for upper_bound, bucket_count in zip(BUCKETS, bucket_counts):
+                cumulative += bucket_count
+                lines.append('faceorienter_stage_duration_seconds_bucket{stage="%s",le="%s"} %d'
+                             % (stage, repr(upper_bound), cumulative))
+            lines.append('faceorienter_stage_duration_seconds_bucket{stage="%s",le="+Inf"} %d' % (stage, count))
+            lines.append('faceorienter_stage_duration_seconds_sum{stage="%s"} %s' % (stage, repr(total)))
+            lines.append('faceorienter_stage_duration_seconds_count{stage="%s"} %d' % (stage, count))
+
+        for counter, value in sorted(_counters.items()):
+            lines.append('# TYPE faceorienter_%s_total counter' % counter)
+            lines.append('faceorienter_%s_total %d' % (counter, value))
+
+    for gauge, value in sorted((gauges or {}).items()):
+        lines.append('# TYPE faceorienter_%s gauge' % gauge)
+        lines.append('faceorienter_%s %s' % (gauge, repr(value)))
+
+    return '\n'.join(lines) + '\n'
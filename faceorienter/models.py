@@ -0,0 +1,143 @@
+"""
+Lazily loaded models. The models are loaded (once, thread-safely) upon first use rather than upon import, so importing
+the package (e.g. for `--help`, or in processes that never detect faces) is fast. Call `warmup` to load them upfront,
+e.g. before forking worker processes, which then share the models' memory copy-on-write.
+
+The models are looked up in the directory given by the environment variable `FACEORIENTER_MODEL_DIR` first (falling
+back to the models bundled with the package). Constructing dlib's frontal face detector is slow (it is deserialized from
+an embedded, compressed representation), so a pre-serialized copy can be placed in that directory using `export_models`,
+e.g. on a volume shared by all workers/pods, which loads in a few milliseconds.
+"""
+import os
+import shutil
+import threading
+
+MODEL_DIR_ENV_VAR = 'FACEORIENTER_MODEL_DIR'
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(__file__), 'model')
+FACE_DETECTOR_FILE = 'frontal_face_detector.svm'
+LANDMARK_DETECTOR_FILE = 'shape_predictor_5_face_landmarks.dat'
+
+_lock = threading.Lock()
+_face_detector = None
+_landmark_detector = None
+
+
+def _find_model(file_name):
+    """
+    Returns
+    -------
+    str | None
+        The path of the model file in the configured model directory, or in the package's model directory (None if it
+        exists in neither)
+    """
+    for model_dir in (os.environ.get(MODEL_DIR_ENV_VAR), DEFAULT_MODEL_DIR):
+        if model_dir and os.path.isfile(os.path.join(model_dir, file_name)):
+            return os.path.join(model_dir, file_name)
+
+    return None
+
+
+def get_face_detector():
+    """
+    Returns
+    -------
+    dlib.fhog_object_detector
+        The HOG face detector (loaded upon first call)
+    """
+    global _face_detector
+
+    if _face_detector is None:
+        with _lock:
+            if _face_detector is None:
+                import dlib
+
+                path = _find_model(FACE_DETECTOR_FILE)
+                _face_detector = dlib.fhog_object_detector(path) if path else dlib.get_frontal_face_detector()
+
+    return _face_detector
+
+
+def get_landmark_detector():
+    """
+    Returns
+    -------
+    dlib.shape_predictor
+        The 5-point facial landmark detector (loaded upon first call)
+    """
+    global _landmark_detector
+
+    if _landmark_detector is None:
+        with _lock:
+            if _landmark_detector is None:
+                import dlib
+
+                path = _find_model(LANDMARK_DETECTOR_FILE)
+                if path is None:
+                    raise FileNotFoundError('Model `%s` was not found.' % LANDMARK_DETECTOR_FILE)
+                _landmark_detector = dlib.shape_predictor(path)
+
+    return _landmark_detector
+
+
+def is_loaded():
+    """
+    Returns
+    -------
+    bool
+        Whether both models have been loaded
+    """
+    return _face_detector is not None and _landmark_detector is not None
+
+
+def warmup():
+    """
+    Loads both models (if they haven't been loaded yet), and runs them once on a blank image, so that the first image
+    doesn't pay for any initialization.
+    """
+    import dlib
+    import numpy as np
+
+    img = np.zeros((80, 80), dtype=np.uint8)
+    get_face_detector()(img)
+    get_landmark_detector()(img, dlib.rectangle(0, 0, 79, 79))
+
+
+def export_models(model_dir):
+    """
+    Writes the models to a directory, with the face detector pre-serialized so that it loads quickly. Point the
+    environment variable `FACEORIENTER_MODEL_DIR` to that directory to load the models from there.
+
+    Parameters
+    ----------
+    model_dir : str
+        The target directory (created if it doesn't exist)
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    get_face_detector().save(os.path.join(model_dir, FACE_DETECTOR_FILE))
+
+    landmark_detector_path = _find_model(LANDMARK_DETECTOR_FILE)
+    if os.path.abspath(landmark_detector_path) != os.path.abspath(os.path.join(model_dir, LANDMARK_DETECTOR_FILE)):
+        shutil.copyfile(landmark_detector_path, os.path.join(model_dir, LANDMARK_DETECTOR_FILE))
+
+
+class LazyModel(object):
+    """
+    A stand-in for a model, which loads it upon first use (calls and attribute accesses are passed on to the model)
+    """
+    def __init__(self, loader):
+        """
+        Parameters
+        ----------
+        loader : callable
+            Returns the model (e.g. `get_face_detector`)
+        """
+        self.__loader = loader
+
+    def __call__(self, *args, **kwargs):
+        return self.__loader()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith('_LazyModel__'):  # Not initialized (e.g. while being copied)
+            raise AttributeError(name)
+
+        return getattr(self.__loader(), name)
@@ -1,4 +1,43 @@
 from flask import Flask
 
+app = Flask('FaceOrienter')
 
-app = Flask('FaceOrienter')
\ No newline at end of file
+# Uploads larger than `MAX_CONTENT_LENGTH` bytes are rejected (413), as are images with more than `MAX_IMAGE_PIXELS`
+# pixels (checked before the image is decoded, if its dimensions can be read from its header)
+app.config.update(
+    MAX_CONTENT_LENGTH=16 * 1024 * 1024,
+    MAX_IMAGE_PIXELS=50 * 1000 * 1000,
+)
+
+# Settings of the inference scheduler (see `scheduler.InferenceScheduler`), which runs detection for all requests. When
+# serving using preforked worker processes, the queue size is derived from the number of threads (see `__main__`)
+app.config.update(
+    DETECTOR_WORKERS=1,
+    DETECTOR_QUEUE_SIZE=64,
+)
+
+# Settings of the prediction cache (see `faceorienter.cache`). If a path is set, an on-disk cache is used, which is
+# shared between all server worker processes. Otherwise, each process uses its own in-memory cache. A size of 0
+# disables caching
+app.config.update(
+    CACHE_SIZE=1024,
+    CACHE_TTL=None,
+    CACHE_PATH=None,
+)
+
+# If enabled, each process learns which orientations are the most frequent, and tries them first during face detection
+# (see `faceorienter.rotation_order`)
+app.config.update(
+    ADAPTIVE_ROTATION_ORDER=False,
+)
+
+# If set, faces are detected again on upsampled images if the confidence of a prediction is below this threshold
+app.config.update(
+    ESCALATION_THRESHOLD=None,
+)
+
+# If set, images are processed in low-memory mode, limiting the working memory of detection to this many bytes per image
+# (see the `memory_budget` parameter of `FaceOrienter`)
+app.config.update(
+    MEMORY_BUDGET=None,
+)
\ No newline at end of file
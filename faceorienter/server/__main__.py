@@ -1,12 +1,90 @@
 from argparse import ArgumentParser
+from multiprocessing import cpu_count
 
 from . import app, routes
+from .. import metrics, models
 
 parser = ArgumentParser()
 parser.add_argument('-s', '--host', type=str, required=False, default='0.0.0.0',
                     help='Server host (see Flask docs)')
 parser.add_argument('-p', '--port', type=int, required=False, default=5000,
                     help='Server port (see Flask docs)')
+parser.add_argument('-w', '--workers', type=int, required=False, default=cpu_count(),
+                    help='Number of worker processes (defaults to the number of CPUs)')
+parser.add_argument('-t', '--threads', type=int, required=False, default=4,
+                    help='Number of threads per worker process (i.e. the number of requests it handles at once)')
+parser.add_argument('--timeout', type=int, required=False, default=30,
+                    help='Request timeout in seconds (workers exceeding it are restarted)')
+parser.add_argument('--max-upload-size', type=int, required=False, default=app.config['MAX_CONTENT_LENGTH'],
+                    help='Maximum upload size in bytes (larger requests are rejected)')
+parser.add_argument('--max-image-pixels', type=int, required=False, default=app.config['MAX_IMAGE_PIXELS'],
+                    help='Maximum number of pixels of uploaded images (larger images are rejected before decoding)')
+parser.add_argument('--detector-workers', type=int, required=False, default=app.config['DETECTOR_WORKERS'],
+                    help='Number of detector threads per worker process')
+parser.add_argument('--queue-size', type=int, required=False, default=None,
+                    help='Maximum number of requests waiting for a detector per worker process (if the queue is '
+                         'full, requests are rejected with 503). Must be smaller than the number of threads minus the '
+                         'number of detector threads (which is the default, minus one)')
+parser.add_argument('--cache-size', type=int, required=False, default=app.config['CACHE_SIZE'],
+                    help='Maximum number of cached predictions (0 disables caching)')
+parser.add_argument('--cache-ttl', type=float, required=False, default=app.config['CACHE_TTL'],
+                    help='Time (in seconds) after which cached predictions expire')
+parser.add_argument('--cache-path', type=str, required=False, default=app.config['CACHE_PATH'],
+                    help='Path to an SQLite database used as prediction cache shared by all worker processes '
+                         '(by default, each worker process uses its own in-memory cache)')
+parser.add_argument('--adaptive-rotation-order', action='store_true',
+                    help='Try the most frequent orientation first during face detection, instead of the original one '
+                         '(fewer detector passes, but predictions may differ if faces are found in several '
+                         'orientations)')
+parser.add_argument('--escalation-threshold', type=float, required=False, default=app.config['ESCALATION_THRESHOLD'],
+                    help='Detect faces again on upsampled images if the confidence of a prediction is below this '
+                         'threshold (slower, but finds smaller faces)')
+parser.add_argument('--memory-budget', type=int, required=False, default=app.config['MEMORY_BUDGET'],
+                    help='Process images in low-memory mode, limiting the working memory of detection to this many '
+                         'bytes per image (e.g. for very large images)')
+parser.add_argument('--no-metrics', action='store_true',
+                    help='Disable recording of per-stage durations (exposed via /metrics)')
+parser.add_argument('--dev', action='store_true',
+                    help='Use Flask\'s single-process development server instead of preforked workers')
 args = parser.parse_args().__dict__
 
-app.run(host=args['host'], port=args['port'])
+# A worker process handles at most `threads` requests at once, so at most `threads - detector_workers` requests can wait
+# for a detector. Only a smaller queue ever fills up, so that excess requests are rejected (instead of waiting in the
+# listen backlog). Flask's development server uses a thread per request, so any queue size works there
+if args['dev']:
+    if args['queue_size'] is None:
+        args['queue_size'] = app.config['DETECTOR_QUEUE_SIZE']
+elif args['queue_size'] is None:
+    args['queue_size'] = max(args['threads'] - args['detector_workers'] - 1, 1)
+elif args['queue_size'] >= args['threads'] - args['detector_workers']:
+    parser.error('--queue-size must be smaller than --threads minus --detector-workers (%d), since a worker process '
+                 'handles at most --threads requests at once (otherwise, the queue never fills up, and no request is '
+                 'ever rejected)' % (args['threads'] - args['detector_workers']))
+
+app.config.update(
+    MAX_CONTENT_LENGTH=args['max_upload_size'],
+    MAX_IMAGE_PIXELS=args['max_image_pixels'],
+    DETECTOR_WORKERS=args['detector_workers'],
+    DETECTOR_QUEUE_SIZE=args['queue_size'],
+    CACHE_SIZE=args['cache_size'],
+    CACHE_TTL=args['cache_ttl'],
+    CACHE_PATH=args['cache_path'],
+    ADAPTIVE_ROTATION_ORDER=args['adaptive_rotation_order'],
+    ESCALATION_THRESHOLD=args['escalation_threshold'],
+    MEMORY_BUDGET=args['memory_budget'],
+)
+
+# Record per-stage durations and counters, which are exposed via `/metrics` (only when serving, so that importing the
+# server package doesn't enable instrumentation globally)
+if not args['no_metrics']:
+    metrics.enable()
+
+# Load the models before the workers are forked, so that they are shared (see `wsgi.PreforkServer`)
+models.warmup()
+
+if args['dev']:
+    app.run(host=args['host'], port=args['port'])
+else:
+    from .wsgi import serve  # Imported here, since gunicorn is not available on all platforms (e.g. Windows)
+    serve(app, host=args['host'], port=args['port'], workers=args['workers'], threads=args['threads'],
+          timeout=args['timeout'])
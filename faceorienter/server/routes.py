@@ -1,30 +1,479 @@
 import os
-from tempfile import mktemp
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
 
-from flask import request
+import cv2
+from flask import Response, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
 
-from faceorienter import FaceOrienter
+from faceorienter import FaceOrienter, metrics, utils
+from faceorienter.cache import LRUCache, SqliteCache
+from faceorienter.faceorienter import ORIENTATIONS
+from faceorienter.rotation_order import RotationOrderScheduler
 from faceorienter.server import app
+from faceorienter.server.scheduler import InferenceScheduler, QueueFullError
 
+_scheduler = None
+_scheduler_lock = threading.Lock()
+_cache = None
+_cache_lock = threading.Lock()
+_rotation_order = None
+_rotation_order_lock = threading.Lock()
 
-@app.route('/orient', methods=['POST'])
-def orient():  # TODO return proper errors
-    files = request.files
+# Output formats (`format` parameter of `/orient`), their file extensions (as used by `cv2.imencode`) and content types
+OUTPUT_FORMATS = {
+    'jpg': ('.jpg', 'image/jpeg'),
+    'jpeg': ('.jpg', 'image/jpeg'),
+    'png': ('.png', 'image/png'),
+    'webp': ('.webp', 'image/webp'),
+}
+
+# Input formats that `/orient` returns in their own format by default (file extensions that OpenCV can encode, and
+# their content types); other inputs are returned as JPEG
+KEPT_INPUT_FORMATS = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.webp': 'image/webp',
+    '.bmp': 'image/bmp',
+    '.tif': 'image/tiff',
+    '.tiff': 'image/tiff',
+}
+
+# Size of the chunks in which raw uploads are read from the request stream
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def get_scheduler():
+    """
+    Returns the inference scheduler of the current process (it is created upon first use, so that each forked server
+    worker process gets its own scheduler threads).
+
+    Returns
+    -------
+    InferenceScheduler
+    """
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = InferenceScheduler(_run_task,
+                                            workers=app.config['DETECTOR_WORKERS'],
+                                            max_queue_size=app.config['DETECTOR_QUEUE_SIZE'])
+
+    return _scheduler
+
+
+def get_cache():
+    """
+    Returns the prediction cache of the current process (created upon first use), or None if caching is disabled.
+
+    Returns
+    -------
+    faceorienter.cache.PredictionCache | None
+    """
+    global _cache
+
+    with _cache_lock:
+        if _cache is None and app.config['CACHE_SIZE'] > 0:
+            if app.config['CACHE_PATH']:
+                _cache = SqliteCache(app.config['CACHE_PATH'], max_size=app.config['CACHE_SIZE'],
+                                     ttl=app.config['CACHE_TTL'])
+            else:
+                _cache = LRUCache(max_size=app.config['CACHE_SIZE'], ttl=app.config['CACHE_TTL'])
+
+    return _cache
+
+
+def get_rotation_order():
+    """
+    Returns the rotation order scheduler of the current process (created upon first use), or None if the adaptive
+    rotation order is disabled.
+
+    Returns
+    -------
+    faceorienter.rotation_order.RotationOrderScheduler | None
+    """
+    global _rotation_order
+
+    with _rotation_order_lock:
+        if _rotation_order is None and app.config['ADAPTIVE_ROTATION_ORDER']:
+            _rotation_order = RotationOrderScheduler()
+
+    return _rotation_order
+
+
+def _get_orientation_hint():
+    """
+    Returns
+    -------
+    str | None
+        The orientation hint supplied by the client (query or form field `orientation_hint`), if any
+
+    Raises
+    ------
+    ValueError
+        If the hint is not a valid orientation
+    """
+    hint = request.values.get('orientation_hint') or None
+    if hint is not None and hint not in ORIENTATIONS:
+        raise ValueError('Invalid orientation hint `%s` (expected one of %s).' % (hint, ', '.join(ORIENTATIONS)))
+
+    return hint
+
+
+def _get_roi():
+    """
+    Returns
+    -------
+    list | None
+        The region of interest supplied by the client (query or form field `roi`, formatted as `left,top,right,bottom`
+        in pixels), if any
+
+    Raises
+    ------
+    ValueError
+        If the region of interest is malformed
+    """
+    roi = request.values.get('roi') or None
+    if roi is None:
+        return None
+
+    try:
+        left, top, right, bottom = [int(v) for v in roi.split(',')]
+    except ValueError:
+        raise ValueError('Invalid region of interest `%s` (expected `left,top,right,bottom`).' % roi)
+    if right <= left or bottom <= top:
+        raise ValueError('Invalid region of interest `%s` (empty region).' % roi)
+
+    return [left, top, right, bottom]
+
+
+def _create_face_orienter(image_bytes, orientation_hint=None, roi=None):
+    return FaceOrienter.from_bytes(image_bytes, cache=get_cache(), rotation_order=get_rotation_order(),
+                                   orientation_hint=orientation_hint,
+                                   escalation_threshold=app.config['ESCALATION_THRESHOLD'], roi=roi,
+                                   memory_budget=app.config['MEMORY_BUDGET'])
+
+
+def _run_task(func, *args):
+    return func(*args)
+
+
+def _read_stream(stream, length=None, max_length=None):
+    """
+    Reads a raw upload from the request stream in chunks. If its length is known, the chunks are copied into a single,
+    preallocated buffer, so that memory usage doesn't exceed the size of the upload (plus one chunk), and nothing is
+    spooled to disk (as multipart uploads are).
+
+    Parameters
+    ----------
+    stream : file-like
+        The request stream
+    length : int | None
+        The length of the upload (`Content-Length`), if known
+    max_length : int | None
+        The maximum length of the upload
+
+    Returns
+    -------
+    bytearray
+        The upload
+
+    Raises
+    ------
+    werkzeug.exceptions.RequestEntityTooLarge
+        If the upload exceeds `max_length`
+    """
+    if max_length is not None and length is not None and length > max_length:
+        raise RequestEntityTooLarge()
+
+    if length is None:
+        buf = bytearray()
+        for chunk in iter(lambda: stream.read(STREAM_CHUNK_SIZE), b''):
+            buf += chunk
+            if max_length is not None and len(buf) > max_length:
+                raise RequestEntityTooLarge()
+        return buf
+
+    buf, n_read = bytearray(length), 0
+    while n_read < length:
+        chunk = stream.read(min(STREAM_CHUNK_SIZE, length - n_read))
+        if not chunk:  # The client sent less than announced
+            del buf[n_read:]
+            break
+        buf[n_read:n_read + len(chunk)] = chunk
+        n_read += len(chunk)
+
+    return buf
+
+
+def _get_upload():
+    """
+    Returns the uploaded image: either the raw request body, if it is sent with an image content type (e.g.
+    `image/jpeg`) or `application/octet-stream`, which is read straight from the request stream (see `_read_stream`), or
+    the multipart/form-data field `image`.
+
+    Returns
+    -------
+        image_bytes : bytes | bytearray | None
+            The encoded image (None if no image was uploaded)
+        img_ext : str | None
+            The extension matching the image's format (according to its content type or file name), if known
+
+    Raises
+    ------
+    werkzeug.exceptions.RequestEntityTooLarge
+        If the upload exceeds `MAX_CONTENT_LENGTH`, or the image's dimensions exceed `MAX_IMAGE_PIXELS`
+    """
+    if request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream':
+        image_bytes = _read_stream(request.stream, request.content_length, app.config['MAX_CONTENT_LENGTH'])
+        img_ext = {content_type: ext for ext, content_type in OUTPUT_FORMATS.values()}.get(request.mimetype)
+    elif 'image' in request.files:
+        f = request.files['image']
+        image_bytes, img_ext = f.read(), os.path.splitext(f.filename)[1] or None
+    else:
+        return None, None
+
+    _check_image_size(image_bytes)
+
+    return image_bytes, img_ext
+
+
+def _check_image_size(image_bytes):
+    """
+    Rejects huge images before they are decoded (their decoded size may be orders of magnitude larger than the upload),
+    if their dimensions can be read from their header.
+
+    Raises
+    ------
+    werkzeug.exceptions.RequestEntityTooLarge
+        If the image's dimensions exceed `MAX_IMAGE_PIXELS`
+    """
+    size = utils.read_image_size(image_bytes)
+    if size is not None and app.config['MAX_IMAGE_PIXELS'] and size[0] * size[1] > app.config['MAX_IMAGE_PIXELS']:
+        raise RequestEntityTooLarge('The image\'s dimensions (%dx%d) exceed the maximum of %d pixels.'
+                                    % (size[0], size[1], app.config['MAX_IMAGE_PIXELS']))
+
+
+def _fix_orientation(image_bytes, img_ext, orientation_hint=None, quality=None, roi=None):
+    return _create_face_orienter(image_bytes, orientation_hint, roi).get_fixed_image_bytes(img_ext, quality=quality)
+
+
+def _predict(image_bytes, orientation_hint=None, roi=None):
+    start = time.time()
+    fo = _create_face_orienter(image_bytes, orientation_hint, roi)
+    orientation, confidence = fo.predict_orientation_with_confidence()
+    landmarks, face_rect = fo.get_original_landmarks(), fo.get_original_face_rect()
+    if face_rect is not None:
+        face_rect = dict(zip(('left', 'top', 'right', 'bottom'), face_rect.tolist()))
+
+    return {
+        'orientation': orientation,
+        'confidence': confidence,
+        'n_rotations': fo.n_rotations,
+        'landmarks': landmarks.tolist() if landmarks is not None else None,
+        'face_rect': face_rect,
+        'roi_hit': fo.roi_hit,
+        'time': time.time() - start,
+    }
 
-    if 'image' in files:
-        f = files['image']
-        img_ext = os.path.splitext(f.filename)[1]
-        img_tmp = mktemp(suffix=img_ext)
-        f.save(img_tmp)
-        fo = FaceOrienter(img_tmp)
 
-        img_fixed_tmp = mktemp(suffix=img_ext)
-        fo.fix_orientation(img_fixed_tmp)
-        img_new_bytes = open(img_fixed_tmp, 'rb').read()
+def _error(message, status):
+    return jsonify({'error': message}), status
 
-        os.remove(img_tmp)
-        os.remove(img_fixed_tmp)
 
-        return img_new_bytes
+@app.errorhandler(RequestEntityTooLarge)
+def request_entity_too_large(e):
+    return _error(e.description, 413)
+
+
+@app.route('/orient', methods=['POST'])
+def orient():
+    """
+    Fixes the orientation of an image (raw request body with an image content type, or multipart/form-data field
+    `image`), and returns the fixed image. The output format defaults to the input's format (if it can be encoded,
+    otherwise JPEG), and can be chosen using the parameter `format` (jpg/png/webp), along with the `quality` (1-100) of
+    JPEG/WebP images.
+    """
+    image_bytes, img_ext = _get_upload()
+    if image_bytes is None:
+        return _error('No image supplied (expected an image as request body, or a multipart/form-data field '
+                      '`image`).', 400)
+
+    try:
+        orientation_hint, roi = _get_orientation_hint(), _get_roi()
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    output_format = request.values.get('format')
+    if output_format is not None:
+        if output_format not in OUTPUT_FORMATS:
+            return _error('Unsupported output format `%s` (expected one of %s).'
+                          % (output_format, ', '.join(sorted(OUTPUT_FORMATS))), 400)
+        output_ext, content_type = OUTPUT_FORMATS[output_format]
+    elif img_ext and img_ext.lower() in KEPT_INPUT_FORMATS:
+        output_ext = img_ext.lower()
+        content_type = KEPT_INPUT_FORMATS[output_ext]
     else:
-        return ''
+        output_ext, content_type = OUTPUT_FORMATS['jpg']
+
+    quality = request.values.get('quality', type=int)
+    if quality is not None and not 1 <= quality <= 100:
+        return _error('The quality must be between 1 and 100.', 400)
+
+    try:
+        result = get_scheduler().submit(_fix_orientation, image_bytes, output_ext, orientation_hint, quality, roi)
+    except QueueFullError:
+        response, status = _error('Server is busy, try again later.', 503)
+        return response, status, {'Retry-After': '1'}
+
+    try:
+        return Response(result.result(), content_type=content_type)
+    except cv2.error:
+        return _error('The supplied file is not a valid image.', 400)
+
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    """
+    Predicts the orientation of a single image (raw request body with an image content type, or multipart/form-data
+    field `image`) and returns the result as JSON
+    """
+    image_bytes, _ = _get_upload()
+    if image_bytes is None:
+        return _error('No image supplied (expected an image as request body, or a multipart/form-data field '
+                      '`image`).', 400)
+
+    try:
+        orientation_hint, roi = _get_orientation_hint(), _get_roi()
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    try:
+        result = get_scheduler().submit(_predict, image_bytes, orientation_hint, roi)
+    except QueueFullError:
+        response, status = _error('Server is busy, try again later.', 503)
+        return response, status, {'Retry-After': '1'}
+
+    try:
+        return jsonify(result.result())
+    except cv2.error:
+        return _error('The supplied file is not a valid image.', 400)
+
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Predicts the orientations of multiple images (one or more fields `image`). At most one image per detector worker
+    is submitted to the scheduler at a time (the next one once a previous one is done), so that a large batch neither
+    fills the queue shared with other requests, nor is rejected partially. The results are returned as JSON, in the
+    order of the supplied images. Images that could not be processed get an `error` instead of a result. An orientation
+    hint and a region of interest apply to all images.
+    """
+    files = request.files.getlist('image')
+    if len(files) == 0:
+        return _error('No images supplied (expected one or more multipart/form-data fields `image`).', 400)
+
+    try:
+        orientation_hint, roi = _get_orientation_hint(), _get_roi()
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    scheduler = get_scheduler()
+    results = [None] * len(files)
+    in_flight = {}  # Future -> index of the image
+
+    def collect_first_completed():
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            index = in_flight.pop(future)
+            try:
+                results[index] = future.result()
+            except cv2.error:
+                results[index] = {'error': 'The supplied file is not a valid image.'}
+
+    for i, f in enumerate(files):
+        image_bytes = f.read()
+        try:
+            _check_image_size(image_bytes)
+        except RequestEntityTooLarge as e:
+            results[i] = {'error': e.description}
+            continue
+
+        while results[i] is None:
+            if len(in_flight) >= scheduler.workers:
+                collect_first_completed()
+            try:
+                in_flight[scheduler.submit(_predict, image_bytes, orientation_hint, roi)] = i
+                break
+            except QueueFullError:
+                # The queue is full of other requests' tasks: wait for one of our own, unless none is in flight
+                if in_flight:
+                    collect_first_completed()
+                else:
+                    results[i] = {'error': 'Server is busy, try again later.'}
+
+    while in_flight:
+        collect_first_completed()
+
+    for f, result in zip(files, results):
+        result['filename'] = f.filename
+
+    return jsonify({'results': results})
+
+
+def _get_max_rss():
+    """
+    Returns the peak resident set size (RSS) of the current process in bytes, or None if it is unknown (e.g. on
+    Windows). Unlike tracing allocations (see `metrics.trace_memory`), this adds no overhead and is not confused by
+    concurrent requests, but covers the whole lifetime of the process.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024  # Linux reports kilobytes
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Returns the metrics recorded by the current process (see `faceorienter.metrics`) in the Prometheus text format, as
+    well as the inference scheduler's, the prediction cache's and the rotation order's state. Note that each server
+    worker process records its own metrics, which are not aggregated: a request is answered by whichever worker process
+    accepts it (identified by the `worker_pid` gauge).
+    """
+    scheduler, cache, rotation_order = get_scheduler(), get_cache(), get_rotation_order()
+    gauges = {
+        'queue_depth': scheduler.queue_depth,
+        'scheduler_tasks': scheduler.n_tasks,
+        'worker_pid': os.getpid(),
+    }
+    if _get_max_rss() is not None:
+        gauges['max_rss_bytes'] = _get_max_rss()
+    if cache is not None:
+        gauges.update(cache_hits=cache.hits, cache_misses=cache.misses)
+    if rotation_order is not None:
+        stats = rotation_order.stats()
+        gauges.update(rotation_order_images=stats['images'],
+                      rotation_order_detection_passes=stats['detection_passes'],
+                      rotation_order_mean_detection_passes=stats['mean_detection_passes'],
+                      rotation_order_first=stats['order'][0])
+
+    text = '# Metrics of server worker process %d only (each worker process records its own)\n' % os.getpid()
+    return Response(text + metrics.to_prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/rotation-order', methods=['GET'])
+def get_rotation_order_stats():
+    """Returns the statistics of the adaptive rotation order of the current process as JSON"""
+    rotation_order = get_rotation_order()
+    if rotation_order is None:
+        return _error('The adaptive rotation order is disabled.', 404)
+
+    return jsonify(rotation_order.stats())
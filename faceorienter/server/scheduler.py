@@ -0,0 +1,89 @@
+import threading
+from concurrent.futures import Future
+from queue import Queue, Full
+
+
+class QueueFullError(Exception):
+    """Raised when a task is submitted to an InferenceScheduler whose queue is full"""
+    pass
+
+
+class InferenceScheduler(object):
+    """
+    Runs tasks on a fixed pool of worker threads. A task is picked up as soon as a worker is available, so tasks only
+    wait while all workers are busy. They then pile up in a bounded queue (instead of an unbounded number of request
+    threads), and submitting a task to a full queue fails immediately.
+
+    Tasks are not batched, since neither detector can process multiple images at once (running a batch of tasks one
+    after another would only delay the first ones).
+
+    Note that threads are not carried over to forked processes, so a scheduler should be created after forking (e.g.
+    lazily, upon the first request of a server worker process).
+    """
+    def __init__(self, func, workers=1, max_queue_size=64):
+        """
+        Parameters
+        ----------
+        func : callable
+            The function that is applied to each task's arguments
+        workers : int
+            Number of worker threads (i.e. the number of tasks processed concurrently)
+        max_queue_size : int
+            Maximum number of tasks waiting to be processed
+        """
+        self.func = func
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+
+        self.n_tasks = 0
+
+        self.__queue = Queue(max_queue_size)
+        self.__lock = threading.Lock()
+        self.__threads = [threading.Thread(target=self.__work, daemon=True) for _ in range(workers)]
+        for thread in self.__threads:
+            thread.start()
+
+    @property
+    def queue_depth(self):
+        """Number of tasks currently waiting to be processed"""
+        return self.__queue.qsize()
+
+    def submit(self, *args):
+        """
+        Submits a task.
+
+        Parameters
+        ----------
+        args
+            Arguments passed on to `func`
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The task's result
+
+        Raises
+        ------
+        QueueFullError
+            If the queue is full
+        """
+        future = Future()
+        try:
+            self.__queue.put_nowait((args, future))
+        except Full:
+            raise QueueFullError('The queue is full (%d tasks).' % self.max_queue_size)
+
+        return future
+
+    def __work(self):
+        while True:
+            args, future = self.__queue.get()
+            with self.__lock:
+                self.n_tasks += 1
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                future.set_result(self.func(*args))
+            except Exception as e:
+                future.set_exception(e)
@@ -0,0 +1,57 @@
+from gunicorn.app.base import BaseApplication
+
+
+class PreforkServer(BaseApplication):
+    """
+    Serves a WSGI app using gunicorn's preforking worker model. The app is loaded in the master process before the
+    workers are forked, so the models (which are loaded by `faceorienter.models.warmup` before serving) are loaded only
+    once and their memory is shared copy-on-write between all workers.
+    """
+    def __init__(self, app, options):
+        """
+        Parameters
+        ----------
+        app : flask.Flask
+            The app to be served
+        options : dict
+            gunicorn settings (see http://docs.gunicorn.org/en/stable/settings.html)
+        """
+        self.application = app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def serve(app, host='0.0.0.0', port=5000, workers=1, threads=1, timeout=30):
+    """
+    Serves a WSGI app using preforked worker processes.
+
+    Parameters
+    ----------
+    app : flask.Flask
+        The app to be served
+    host : str
+        Server host
+    port : int
+        Server port
+    workers : int
+        Number of worker processes
+    threads : int
+        Number of threads per worker process
+    timeout : int
+        Workers that are silent (e.g. busy with a single request) for more than this many seconds are restarted
+    """
+    PreforkServer(app, {
+        'bind': '%s:%d' % (host, port),
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'timeout': timeout,
+        'preload_app': True,
+    }).run()
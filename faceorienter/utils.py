@@ -1,6 +1,14 @@
+import shutil
+import struct
+import subprocess
+
 import cv2
 import numpy as np
 
+# EXIF orientation tag values and the number of clockwise 90 degree rotations they stand for. Mirrored orientations
+# (2, 4, 5, 7) are not included, since they can't be represented by rotations alone
+EXIF_ORIENTATION_ROTATIONS = {1: 0, 6: 1, 3: 2, 8: 3}
+
 
 def dlib_shape_to_np_array(shape):
     """Converts a dlib shape object (i.e. dlib.full_object_detection) to a numpy array
@@ -15,17 +23,84 @@ def dlib_shape_to_np_array(shape):
     numpy.ndarray
         The resulting array
     """
-    # Init empty array
-    arr = np.zeros((shape.num_parts, 2), dtype=np.int)
+    # Fetch all landmarks at once (instead of calling `shape.part(i)` for each coordinate)
+    return np.array([(point.x, point.y) for point in shape.parts()], dtype=int).reshape(-1, 2)
+
+
+def downscale_image(image, max_side):
+    """
+    Downscales an image (while keeping its aspect ratio) so that its longest side is at most `max_side` pixels long.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        The image to be downscaled
+    max_side : int
+        The maximum length of the image's longest side
+
+    Returns
+    -------
+        image : numpy.ndarray
+            The downscaled image (or the original image, if it is small enough already)
+        scale : float
+            The factor by which the image was scaled (multiply coordinates in the original image by this factor to get
+            the corresponding coordinates in the downscaled image)
+    """
+    (height, width) = image.shape[:2]
+    if max(height, width) <= max_side:
+        return image, 1.
+
+    scale = max_side / float(max(height, width))
+    new_size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+
+    return cv2.resize(image, new_size, interpolation=cv2.INTER_AREA), scale
+
+
+def rotate_image(image, angle, contiguous=False):
+    """
+    Rotates an image clockwise.
+
+    Rotations by multiples of 90 degrees are performed losslessly (no pixels are interpolated). By default, a
+    transposed/flipped view of the image is returned (see `numpy.rot90`), so no pixels are copied at all. If a
+    contiguous image is required (e.g. by dlib, or before encoding the image), `contiguous=True` uses `cv2.rotate`,
+    which is considerably faster than copying the view with numpy.
+
+    Any other angle is handled by an affine transformation (see `_rotate_image_affine`).
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        The image to be rotated
+    angle : int
+        The angle according to which the image should be rotated
+    contiguous : bool
+        Whether quarter turns should return a contiguous copy instead of a view
+
+    Returns
+    -------
+    numpy.ndarray
+        The rotated image
+    """
+    # Validate image dimensions (also for quarter turns, which would otherwise accept arbitrary arrays)
+    (height, width) = image.shape[:2]
 
-    # Convert each landmark to a (x, y) tuple
-    for i in range(0, shape.num_parts):
-        arr[i] = (shape.part(i).x, shape.part(i).y)
+    if angle % 90 == 0:
+        n_rotations = -int(angle // 90) % 4
+        if not contiguous:
+            return np.rot90(image, n_rotations)
+        elif n_rotations == 0:
+            return np.ascontiguousarray(image)
+        else:
+            return cv2.rotate(image, {
+                1: cv2.ROTATE_90_COUNTERCLOCKWISE,
+                2: cv2.ROTATE_180,
+                3: cv2.ROTATE_90_CLOCKWISE
+            }[n_rotations])
 
-    return arr
+    return _rotate_image_affine(image, angle)
 
 
-def rotate_image(image, angle):
+def _rotate_image_affine(image, angle):
     """
     Rotates an image clockwise by performing the following steps:
 
@@ -65,3 +140,307 @@ def rotate_image(image, angle):
 
     # Rotate the image and return
     return cv2.warpAffine(image, matrix, (new_width, new_height))
+
+
+def unrotate_points(points, n_rotations, size):
+    """
+    Maps points located in an image that was rotated clockwise by `n_rotations` * 90 degrees back to the original
+    (unrotated) image.
+
+    Parameters
+    ----------
+    points : numpy.ndarray
+        The (x, y) coordinates in the rotated image (shape: (N, 2))
+    n_rotations : int
+        The number of clockwise 90 degree rotations that were applied to the original image
+    size : (int, int)
+        The original image's (width, height)
+
+    Returns
+    -------
+    numpy.ndarray
+        The (x, y) coordinates in the original image
+    """
+    (width, height) = size
+    x, y = points[:, 0], points[:, 1]
+
+    n_rotations %= 4
+    if n_rotations == 1:
+        x, y = y, height - 1 - x
+    elif n_rotations == 2:
+        x, y = width - 1 - x, height - 1 - y
+    elif n_rotations == 3:
+        x, y = width - 1 - y, x
+
+    return np.stack([x, y], axis=1)
+
+
+def rotate_points(points, n_rotations, size):
+    """
+    Maps points located in an image to the image rotated clockwise by `n_rotations` * 90 degrees (the inverse of
+    `unrotate_points`).
+
+    Parameters
+    ----------
+    points : numpy.ndarray
+        The (x, y) coordinates in the original image (shape: (N, 2))
+    n_rotations : int
+        The number of clockwise 90 degree rotations applied to the image
+    size : (int, int)
+        The original image's (width, height)
+
+    Returns
+    -------
+    numpy.ndarray
+        The (x, y) coordinates in the rotated image
+    """
+    (width, height) = size
+    x, y = points[:, 0], points[:, 1]
+
+    n_rotations %= 4
+    if n_rotations == 1:
+        x, y = height - 1 - y, x
+    elif n_rotations == 2:
+        x, y = width - 1 - x, height - 1 - y
+    elif n_rotations == 3:
+        x, y = y, width - 1 - x
+
+    return np.stack([x, y], axis=1)
+
+
+def _iter_jpeg_segments(data):
+    """
+    Iterates over the header segments of a JPEG byte stream (i.e. all segments up to the start of the image data).
+
+    Parameters
+    ----------
+    data : bytes
+        The JPEG byte stream
+
+    Yields
+    ------
+    (int, int, int)
+        The segment's marker, and the offset and length of its payload
+    """
+    if data[:2] != b'\xff\xd8':
+        return
+
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xff:
+            return
+
+        marker = data[pos + 1]
+        if marker == 0xff:  # Fill byte
+            pos += 1
+            continue
+        if marker in (0xd9, 0xda):  # End of image / start of scan
+            return
+
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        yield marker, pos + 4, length - 2
+        pos += 2 + length
+
+
+def _find_jpeg_orientation(data):
+    """
+    Finds the EXIF orientation tag in a JPEG byte stream.
+
+    Parameters
+    ----------
+    data : bytes
+        The JPEG byte stream
+
+    Returns
+    -------
+    (int, str) | None
+        The offset of the tag's value and the byte order of the EXIF data (or None, if the tag doesn't exist)
+    """
+    try:
+        for marker, offset, length in _iter_jpeg_segments(data):
+            if marker != 0xe1 or data[offset:offset + 6] != b'Exif\x00\x00':
+                continue
+
+            # Parse the TIFF header to find the first image file directory (IFD0), which contains the orientation tag
+            tiff = offset + 6
+            byte_order = {b'II': '<', b'MM': '>'}.get(bytes(data[tiff:tiff + 2]))
+            if byte_order is None:
+                return None
+
+            ifd = tiff + struct.unpack(byte_order + 'I', data[tiff + 4:tiff + 8])[0]
+            for i in range(struct.unpack(byte_order + 'H', data[ifd:ifd + 2])[0]):
+                entry = ifd + 2 + i * 12
+                if entry + 12 > offset + length:
+                    return None
+                if struct.unpack(byte_order + 'H', data[entry:entry + 2])[0] == 0x0112:
+                    return entry + 8, byte_order
+
+            return None
+    except struct.error:  # Truncated data
+        return None
+
+    return None
+
+
+def read_jpeg_orientation(data):
+    """
+    Reads the EXIF orientation tag directly from a JPEG byte stream (without decoding the image).
+
+    Parameters
+    ----------
+    data : bytes
+        The JPEG byte stream
+
+    Returns
+    -------
+    int | None
+        The orientation tag's value (1-8), or None if the data is not a JPEG or the tag doesn't exist
+    """
+    tag = _find_jpeg_orientation(data)
+    if tag is None:
+        return None
+
+    offset, byte_order = tag
+    return struct.unpack(byte_order + 'H', data[offset:offset + 2])[0]
+
+
+def reset_jpeg_orientation(data):
+    """
+    Sets the EXIF orientation tag of a JPEG byte stream to 1 (i.e. "no rotation required"), if it exists.
+
+    Parameters
+    ----------
+    data : bytes
+        The JPEG byte stream
+
+    Returns
+    -------
+    bytes
+        The modified JPEG byte stream
+    """
+    tag = _find_jpeg_orientation(data)
+    if tag is None:
+        return bytes(data)
+
+    offset, byte_order = tag
+    return bytes(data[:offset]) + struct.pack(byte_order + 'H', 1) + bytes(data[offset + 2:])
+
+
+def read_jpeg_size(data):
+    """
+    Reads the dimensions of a JPEG image from its frame header (without decoding the image). Note that the dimensions
+    are those of the stored image, i.e. EXIF orientation is not taken into account.
+
+    Parameters
+    ----------
+    data : bytes
+        The JPEG byte stream
+
+    Returns
+    -------
+    (int, int) | None
+        The image's width and height (or None, if the data is not a JPEG)
+    """
+    try:
+        for marker, offset, length in _iter_jpeg_segments(data):
+            # Start of frame markers (0xc4, 0xc8 and 0xcc are not frame headers)
+            if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+                height, width = struct.unpack('>HH', data[offset + 1:offset + 5])
+                return width, height
+    except struct.error:  # Truncated data
+        return None
+
+    return None
+
+
+def read_image_size(data):
+    """
+    Reads the dimensions of a JPEG or PNG image from its header (without decoding the image), e.g. to reject images that
+    are too large before decoding them. As with `read_jpeg_size`, EXIF orientation is not taken into account.
+
+    Parameters
+    ----------
+    data : bytes | bytearray
+        The encoded image
+
+    Returns
+    -------
+    (int, int) | None
+        The image's width and height (or None, if the data is neither a JPEG nor a PNG)
+    """
+    # PNG: signature, followed by the IHDR chunk (length, type, width, height)
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR' and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
+
+    return read_jpeg_size(data)
+
+
+def decode_reduced_grayscale(data, min_side):
+    """
+    Decodes a JPEG image directly at a reduced resolution (1/2, 1/4 or 1/8, see `cv2.IMREAD_REDUCED_GRAYSCALE_*`),
+    which is much faster than decoding at full resolution and downscaling afterwards. The largest reduction is chosen
+    for which the image's longest side is still at least `min_side` pixels long.
+
+    Parameters
+    ----------
+    data : bytes
+        The JPEG byte stream
+    min_side : int
+        The minimum length of the decoded image's longest side
+
+    Returns
+    -------
+    (numpy.ndarray, float) | None
+        The decoded grayscale image and the factor by which it was scaled (or None, if the data is not a JPEG or is too
+        small to be decoded at a reduced resolution)
+    """
+    size = read_jpeg_size(data)
+    if size is None:
+        return None
+
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                         (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                         (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)):
+        if max(size) / float(factor) >= min_side:
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+            return (image, 1. / factor) if image is not None else None
+
+    return None
+
+
+def rotate_jpeg_lossless(data, angle):
+    """
+    Rotates a JPEG image clockwise by a multiple of 90 degrees without decoding and re-encoding it (i.e. without any
+    loss of quality), by transforming its DCT coefficients using `jpegtran` (from libjpeg/libjpeg-turbo). All metadata
+    is kept, except for the EXIF orientation tag, which is reset to 1.
+
+    Parameters
+    ----------
+    data : bytes
+        The JPEG byte stream
+    angle : int
+        The angle according to which the image should be rotated (must be a multiple of 90)
+
+    Returns
+    -------
+    bytes | None
+        The rotated JPEG byte stream, or None if `jpegtran` is not available or the image can't be rotated losslessly
+        (i.e. its dimensions are not a multiple of the JPEG block size)
+    """
+    if angle % 90 != 0:
+        raise ValueError('JPEG images can only be rotated losslessly by multiples of 90 degrees.')
+
+    angle %= 360
+    if angle == 0:
+        return reset_jpeg_orientation(data)
+
+    jpegtran = shutil.which('jpegtran')
+    if jpegtran is None:
+        return None
+
+    process = subprocess.run([jpegtran, '-copy', 'all', '-perfect', '-rotate', str(angle)], input=bytes(data),
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        return None
+
+    return reset_jpeg_orientation(process.stdout)
@@ -0,0 +1,234 @@
+import os
+from itertools import count
+
+import cv2
+import numpy as np
+
+from . import metrics, utils
+from .faceorienter import ORIENTATIONS, FaceOrienter
+
+# Files of these types are considered frames if a directory is given as image sequence
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+
+
+def _list_images(directory):
+    return [os.path.join(directory, f) for f in sorted(os.listdir(directory))
+            if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS]
+
+
+def iter_frames(source, sample_every=1):
+    """
+    Reads the frames of a video or an image sequence, one at a time. Only every `sample_every`-th frame is decoded
+    (skipped frames of a video are grabbed, but not decoded; skipped images of a sequence are not read at all).
+
+    Parameters
+    ----------
+    source : str | list
+        Path of a video (any format readable by `cv2.VideoCapture`), path of a directory containing an image sequence
+        (sorted by file name), or a list of image paths and/or decoded BGR images
+    sample_every : int
+        Only every n-th frame is yielded (starting with the first frame)
+
+    Yields
+    ------
+    numpy.ndarray
+        The (sampled) frames as BGR arrays
+    """
+    if isinstance(source, str) and os.path.isdir(source):
+        source = _list_images(source)
+
+    if isinstance(source, str):
+        if not os.path.isfile(source):
+            raise FileNotFoundError('File `%s` was not found.' % source)
+
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise ValueError('Video `%s` could not be opened.' % source)
+        try:
+            for i in count():
+                if i % sample_every != 0:
+                    if not capture.grab():
+                        break
+                    continue
+
+                success, frame = capture.read()
+                if not success:
+                    break
+                yield frame
+        finally:
+            capture.release()
+    else:
+        for i, frame in enumerate(source):
+            if i % sample_every != 0:
+                continue
+            if isinstance(frame, str):
+                path, frame = frame, cv2.imread(frame)
+                if frame is None:
+                    raise ValueError('Image `%s` could not be read.' % path)
+            yield frame
+
+
+class VideoOrienter(object):
+    def __init__(self, source, sample_every=10, max_samples=None, roi_padding=0.5, **kwargs):
+        """
+        Predicts the orientation of a video or an image sequence (e.g. a burst of photos), assuming that all frames
+        share the same orientation.
+
+        Faces are only detected on (and only decoded for) every `sample_every`-th frame. Subsequent samples reuse the
+        previous sample's result: faces are searched for in the previous face's (padded) region first, in the previous
+        orientation, which skips rotating the whole frame and retrying other orientations. Only if no face is found
+        there, the whole frame is searched (trying the previous orientation first). The orientation is then predicted by
+        a majority vote across all samples (weighted by their confidence).
+
+        Parameters
+        ----------
+        source : str | list
+            Path of a video, path of a directory containing an image sequence, or a list of image paths and/or decoded
+            BGR images (see `iter_frames`)
+        sample_every : int
+            Faces are detected on every n-th frame only
+        max_samples : int | None
+            If set, detection stops after this many samples (e.g. to bound the processing time of long videos)
+        roi_padding : float
+            Padding (relative to the face's size) added around the previous face's region when searching it first
+        kwargs
+            Passed on to the FaceOrienter constructor (e.g. `max_detection_side`)
+        """
+        if sample_every < 1:
+            raise ValueError('`sample_every` must be at least 1.')
+
+        self.source = source
+        self.sample_every = sample_every
+        self.max_samples = max_samples
+        self.roi_padding = roi_padding
+        self.kwargs = kwargs
+        self.n_region_hits = 0
+
+        # Frame index, predicted orientation and confidence of each sample
+        self.samples = []
+        previous = None
+        for i, frame in enumerate(iter_frames(source, sample_every)):
+            if max_samples is not None and len(self.samples) >= max_samples:
+                break
+
+            metrics.increment('video_samples')
+            orientation, confidence, previous = self.__predict_frame(frame, previous)
+            self.samples.append((i * sample_every, orientation, confidence))
+
+        self.__orientation, self.confidence = self.__vote()
+
+    def __predict_frame(self, frame, previous):
+        """
+        Predicts the orientation of a single frame, searching the previous sample's face region first (see the `roi`
+        parameter of `FaceOrienter`), trying the previous orientation first.
+
+        Parameters
+        ----------
+        frame : numpy.ndarray
+            The frame
+        previous : (numpy.ndarray, str) | None
+            The face's bounding box (in the original frame) and orientation of the previous sample which contained a
+            face (or None)
+
+        Returns
+        -------
+            orientation : str | None
+                The predicted orientation (None if no face was found)
+            confidence : float
+                The confidence of the prediction
+            previous : (numpy.ndarray, str) | None
+                The (updated) result to be reused by the next sample
+        """
+        fo = FaceOrienter.from_array(frame, roi=previous[0] if previous else None, roi_padding=self.roi_padding,
+                                     orientation_hint=previous[1] if previous else None, **self.kwargs)
+        self.n_region_hits += bool(fo.roi_hit)
+
+        orientation, confidence = fo.predict_orientation_with_confidence()
+        if orientation is not None:
+            previous = (fo.get_original_face_rect(), orientation)
+
+        return orientation, confidence, previous
+
+    def __vote(self):
+        """
+        Returns
+        -------
+            orientation : str | None
+                The orientation with the most votes (weighted by confidence), or None if no face was found at all
+            confidence : float
+                The share of the samples' total weight (including samples without faces) voting for the orientation
+        """
+        votes = np.zeros(len(ORIENTATIONS))
+        for _, orientation, confidence in self.samples:
+            if orientation is not None:
+                votes[ORIENTATIONS.tolist().index(orientation)] += confidence
+
+        if votes.sum() == 0:
+            return None, 0.
+
+        winner = int(np.argmax(votes))
+        return str(ORIENTATIONS[winner]), float(votes[winner] / len(self.samples))
+
+    def predict_orientation_with_confidence(self):
+        """
+        Returns
+        -------
+            orientation : str | None
+                Predicted orientation (up/down/right/left) of the video, or None if no face was found in any sample
+            confidence : float
+                Confidence of the prediction (between 0 and 1)
+        """
+        return self.__orientation, self.confidence
+
+    def predict_orientation(self):
+        """
+        Returns
+        -------
+            str
+                Predicted orientation (up/down/right/left). If no face was found, `down` is returned (i.e. the video is
+                left as it is)
+        """
+        return self.__orientation or 'down'
+
+    def fix_orientation(self, save_path, fourcc='mp4v'):
+        """
+        Fixes the orientation of all frames, and writes them to disk one at a time (so that the video is never held in
+        memory as a whole). The source is read a second time for this, so it must not be an iterator.
+
+        Parameters
+        ----------
+        save_path : str
+            Path of the new video (for videos), or directory to which the frames are written (for image sequences, using
+            the original file names if available)
+        fourcc : str
+            Codec of the new video (see `cv2.VideoWriter_fourcc`)
+        """
+        n_rotations = {'down': 0, 'right': 1, 'up': 2, 'left': 3}[self.predict_orientation()]
+        is_video = isinstance(self.source, str) and not os.path.isdir(self.source)
+
+        if is_video:
+            capture = cv2.VideoCapture(self.source)
+            fps = capture.get(cv2.CAP_PROP_FPS) or 25.
+            capture.release()
+            writer = None
+        else:
+            os.makedirs(save_path, exist_ok=True)
+            names = _list_images(self.source) if isinstance(self.source, str) else self.source
+
+        try:
+            for i, frame in enumerate(iter_frames(self.source)):
+                with metrics.timed('rotate'):
+                    frame = utils.rotate_image(frame, n_rotations * 90, contiguous=True)
+
+                with metrics.timed('encode'):
+                    if is_video:
+                        if writer is None:
+                            writer = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*fourcc), fps,
+                                                     (frame.shape[1], frame.shape[0]))
+                        writer.write(frame)
+                    else:
+                        name = os.path.basename(names[i]) if isinstance(names[i], str) else '%06d.png' % i
+                        cv2.imwrite(os.path.join(save_path, name), frame)
+        finally:
+            if is_video and writer is not None:
+                writer.release()
@@ -15,5 +15,5 @@ setup(
     install_requires=requirements,
     python_requires='>=3.3',
     include_package_data=True,
-    package_data={'faceorienter.model': ['shape_predictor_5_face_landmarks.dat']}
+    package_data={'faceorienter.model': ['shape_predictor_5_face_landmarks.dat', '*.svm']}
 )
\ No newline at end of file
@@ -1,20 +1,50 @@
 import sys
 from unittest import TestSuite, TextTestRunner, makeSuite
 
+from .benchmark import Benchmark
+from .benchmark_landmarks import BenchmarkLandmarks
+from .benchmark_rotation import BenchmarkRotation
 from .test_accuracy import TestAccuracy
+from .test_batch import TestBatch
+from .test_cache import TestCache
+from .test_cli import TestCLI
 from .test_faceorienter import TestFaceOrienter
+from .test_metrics import TestMetrics
+from .test_models import TestModels
 from .test_rest_api import TestRestAPI
+from .test_rotation_order import TestRotationOrder
+from .test_scheduler import TestScheduler
 from .test_utils import TestUtils
+from .test_video import TestVideo
+from .test_wsgi import TestWSGI
 
 if len(sys.argv) == 1:
     suite = TestSuite()
     suite.addTest(makeSuite(TestUtils))
     suite.addTest(makeSuite(TestFaceOrienter))
+    suite.addTest(makeSuite(TestBatch))
+    suite.addTest(makeSuite(TestCache))
+    suite.addTest(makeSuite(TestCLI))
+    suite.addTest(makeSuite(TestScheduler))
     suite.addTest(makeSuite(TestRestAPI))
+    suite.addTest(makeSuite(TestMetrics))
+    suite.addTest(makeSuite(TestRotationOrder))
+    suite.addTest(makeSuite(TestModels))
+    suite.addTest(makeSuite(TestVideo))
+    suite.addTest(makeSuite(TestWSGI))
     runner = TextTestRunner(verbosity=2)
     runner.run(suite)
 else:
     if sys.argv[1] == 'accuracy':
-        TestAccuracy.run()
+        if len(sys.argv) > 2:
+            TestAccuracy.run([None if arg == 'full' else int(arg) for arg in sys.argv[2:]])
+        else:
+            TestAccuracy.run()
+    elif sys.argv[1] == 'benchmark':
+        Benchmark.run(sys.argv[2:])
+    elif sys.argv[1] == 'benchmark_rotation':
+        BenchmarkRotation.run()
+    elif sys.argv[1] == 'benchmark_landmarks':
+        BenchmarkLandmarks.run()
     else:
         exit('Unknown command line argument: %s' % sys.argv[1])
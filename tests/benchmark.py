@@ -0,0 +1,205 @@
+"""Reproducible offline benchmark suite. Generates a synthetic dataset locally (rotated variants of the images in
+`tests/res` and, optionally, of local corpora of correctly oriented images, at several resolutions), and measures
+throughput, latency percentiles, peak memory usage and accuracy for several configurations:
+
+- serial vs. pooled (multiple worker processes)
+- full resolution vs. downscaled detection
+- file vs. in-memory I/O
+
+Results are written as JSON (e.g. `python -m tests benchmark --output results.json`), so that they can be compared
+between releases."""
+import json
+import os
+import platform
+import resource
+import time
+from argparse import ArgumentParser
+from itertools import product
+from multiprocessing import cpu_count, get_context
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import cv2
+import numpy as np
+
+from faceorienter import FaceOrienter, models
+from faceorienter.utils import downscale_image, rotate_image
+
+
+def _predict_timed(task):
+    """Predicts the orientation of a single image, and measures how long it took (runs inside the worker processes)"""
+    i, image, kwargs = task
+
+    start = time.perf_counter()
+    if isinstance(image, bytes):
+        orientation = FaceOrienter.from_bytes(image, **kwargs).predict_orientation()
+    else:
+        orientation = FaceOrienter(image, **kwargs).predict_orientation()
+
+    return i, orientation, time.perf_counter() - start
+
+
+def _run_configuration(images, workers, kwargs, connection):
+    """Processes all images using one configuration (runs inside a separate process, so that peak memory usage is
+    measured per configuration), and sends the predictions, latencies and elapsed time back via `connection`"""
+    tasks = [(i, image, kwargs) for i, image in enumerate(images)]
+
+    # Load the models before measuring (and before forking, so that the pool's workers inherit them), so that the first
+    # images don't include the time it takes to load them
+    models.warmup()
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = list(map(_predict_timed, tasks))
+    else:
+        with get_context('fork').Pool(workers) as pool:
+            results = list(pool.imap_unordered(_predict_timed, tasks, 4))
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is given in kilobytes on Linux (and in bytes on macOS)
+    unit = 1024. if platform.system() != 'Darwin' else 1.
+    connection.send({
+        'results': results,
+        'elapsed': elapsed,
+        'peak_rss_mb': {
+            'main': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2 ** 20,
+            'workers': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 2 ** 20,
+        },
+    })
+    connection.close()
+
+
+class Benchmark(object):
+    res_dir = os.path.join(os.path.dirname(__file__), 'res')
+
+    # Correctly oriented images (containing faces) of `res_dir`, and images without faces
+    res_images = ['gates_down.jpg']
+    res_images_without_face = ['black_square.jpg']
+
+    # Rotating a correctly oriented image clockwise by 0, 90, 180 and 270 degrees results in these orientations
+    rotated_orientations = ['down', 'left', 'up', 'right']
+
+    @classmethod
+    def _generate_dataset(cls, dataset_dir, corpora, sizes):
+        """
+        Writes rotated variants of all source images to `dataset_dir`, at each size (longest side in pixels).
+
+        Returns
+        -------
+        list of (str, str | None)
+            Paths of the generated images and their orientations (None for images without faces)
+        """
+        sources = [(os.path.join(cls.res_dir, f), True) for f in cls.res_images]
+        sources += [(os.path.join(cls.res_dir, f), False) for f in cls.res_images_without_face]
+        for corpus in corpora:
+            sources += [(os.path.join(corpus, f), True) for f in sorted(os.listdir(corpus))
+                        if os.path.splitext(f)[1].lower() in ('.jpg', '.jpeg', '.png')]
+
+        dataset = []
+        for (source, has_face), size in product(sources, sizes):
+            img = cv2.imread(source)
+            if img is None:
+                continue
+
+            # Scale to the requested size (up or down), keeping the aspect ratio
+            scale = size / float(max(img.shape[:2]))
+            if scale < 1:
+                img, _ = downscale_image(img, size)
+            elif scale > 1:
+                img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+
+            for n_rotations, orientation in enumerate(cls.rotated_orientations):
+                path = os.path.join(dataset_dir, '%s_%d_%d.jpg' % (os.path.splitext(os.path.basename(source))[0],
+                                                                    size, n_rotations * 90))
+                cv2.imwrite(path, rotate_image(img, n_rotations * 90, contiguous=True))
+                dataset.append((path, orientation if has_face else None))
+
+        return dataset
+
+    @classmethod
+    def _measure(cls, dataset, workers, in_memory, kwargs):
+        """Runs one configuration in a separate process and summarizes its results"""
+        if in_memory:
+            images = []
+            for path, _ in dataset:
+                with open(path, 'rb') as img_fp:
+                    images.append(img_fp.read())
+        else:
+            images = [path for path, _ in dataset]
+
+        context = get_context('fork')
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_run_configuration, args=(images, workers, kwargs, sender))
+        process.start()
+        measurement = receiver.recv()
+        process.join()
+
+        latencies = np.array([latency for _, _, latency in measurement['results']])
+        predictions = {i: orientation for i, orientation, _ in measurement['results']}
+        labeled = [(i, orientation) for i, (_, orientation) in enumerate(dataset) if orientation is not None]
+        correct = sum(predictions[i] == orientation for i, orientation in labeled)
+
+        return {
+            'n_images': len(dataset),
+            'elapsed_s': measurement['elapsed'],
+            'throughput_images_per_s': len(dataset) / measurement['elapsed'],
+            'latency_ms': {
+                'mean': float(latencies.mean() * 1000),
+                'p50': float(np.percentile(latencies, 50) * 1000),
+                'p95': float(np.percentile(latencies, 95) * 1000),
+                'p99': float(np.percentile(latencies, 99) * 1000),
+            },
+            'peak_rss_mb': measurement['peak_rss_mb'],
+            'accuracy': correct / float(len(labeled)) if labeled else None,
+        }
+
+    @classmethod
+    def run(cls, argv=None):
+        parser = ArgumentParser(prog='python -m tests benchmark')
+        parser.add_argument('-o', '--output', type=str, required=False, default=None,
+                            help='Path of the JSON file to which results are written (default: print to stdout)')
+        parser.add_argument('-c', '--corpus', type=str, action='append', default=[],
+                            help='Directory containing additional, correctly oriented images (can be repeated)')
+        parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[400, 1000, 2000],
+                            help='Sizes (longest side in pixels) at which images are generated')
+        parser.add_argument('-w', '--workers', type=int, required=False, default=cpu_count(),
+                            help='Number of worker processes for the pooled configurations')
+        parser.add_argument('--max-detection-side', type=int, nargs='+', default=[400],
+                            help='Maximum detection sizes for the downscaled configurations (e.g. `800 400 200 150` to '
+                                 'find out where accuracy starts to degrade)')
+        args = parser.parse_args(argv)
+
+        dataset_dir = mkdtemp()
+        try:
+            print('Generating dataset in `%s`...' % dataset_dir)
+            dataset = cls._generate_dataset(dataset_dir, args.corpus, args.sizes)
+
+            results = []
+            for workers, max_detection_side, in_memory in product((1, args.workers),
+                                                                  [None] + args.max_detection_side, (False, True)):
+                config = {'workers': workers, 'max_detection_side': max_detection_side, 'in_memory': in_memory}
+                print('Measuring %s...' % json.dumps(config))
+                result = cls._measure(dataset, workers, in_memory, {'max_detection_side': max_detection_side})
+                results.append(dict(config=config, **result))
+        finally:
+            rmtree(dataset_dir)
+
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'platform': {
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpu_count': cpu_count(),
+                'opencv': cv2.__version__,
+                'numpy': np.__version__,
+            },
+            'dataset': {'sizes': args.sizes, 'corpora': args.corpus, 'n_images': len(dataset)},
+            'results': results,
+        }
+
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                json.dump(report, output_file, indent=2)
+            print('Results written to `%s`' % args.output)
+        else:
+            print(json.dumps(report, indent=2))
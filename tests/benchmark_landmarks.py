@@ -0,0 +1,69 @@
+"""Benchmark comparing the vectorized landmark conversion and orientation prediction with the previous per-object
+implementation (a Python loop over each landmark, and per-image predictions)."""
+import timeit
+
+import numpy as np
+from dlib import full_object_detection, point, rectangle
+
+from faceorienter import predict_orientations_from_landmarks, utils
+
+
+def _dlib_shape_to_np_array_per_point(shape):
+    """The previous implementation of `utils.dlib_shape_to_np_array`"""
+    arr = np.zeros((shape.num_parts, 2), dtype=int)
+    for i in range(0, shape.num_parts):
+        arr[i] = (shape.part(i).x, shape.part(i).y)
+
+    return arr
+
+
+def _predict_orientation_per_image(landmarks, n_rotations):
+    """The previous implementation of `FaceOrienter.predict_orientation`"""
+    eye_l_center = landmarks[0:1].mean(axis=0).astype(int)
+    eye_r_center = landmarks[2:3].mean(axis=0).astype(int)
+    nose_point = landmarks[4]
+
+    if eye_l_center[0] >= nose_point[0] >= eye_r_center[0]:
+        orientation = 0 if nose_point[1] >= (eye_l_center[1] + eye_r_center[1]) / 2 else 2
+    else:
+        orientation = 3 if nose_point[0] >= (eye_l_center[0] + eye_r_center[0]) / 2 else 1
+
+    return ['down', 'right', 'up', 'left'][(n_rotations + orientation) % 4]
+
+
+class BenchmarkLandmarks(object):
+    batch_sizes = [1, 100, 10000]
+    repeat = 5
+
+    @classmethod
+    def _time(cls, func):
+        """Returns the best of `repeat` runs (in milliseconds)"""
+        return min(timeit.repeat(func, number=1, repeat=cls.repeat)) * 1000
+
+    @classmethod
+    def run(cls):
+        print('%-10s  %20s  %20s  %20s  %20s' % ('batch size', 'convert loop (ms)', 'convert (ms)',
+                                                  'predict loop (ms)', 'predict batch (ms)'))
+        print('-' * 100)
+
+        rng = np.random.RandomState(0)
+        for batch_size in cls.batch_sizes:
+            landmarks = rng.randint(0, 1000, (batch_size, 5, 2))
+            n_rotations = rng.randint(0, 4, batch_size)
+            shapes = [full_object_detection(rectangle(0, 0, 1000, 1000), [point(int(x), int(y)) for x, y in points])
+                      for points in landmarks]
+
+            # Make sure both implementations yield the same results
+            assert all(np.array_equal(utils.dlib_shape_to_np_array(shape), _dlib_shape_to_np_array_per_point(shape))
+                       for shape in shapes)
+            assert predict_orientations_from_landmarks(landmarks, n_rotations).tolist() == \
+                [_predict_orientation_per_image(points, n) for points, n in zip(landmarks, n_rotations)]
+
+            convert_loop = cls._time(lambda: [_dlib_shape_to_np_array_per_point(shape) for shape in shapes])
+            convert = cls._time(lambda: [utils.dlib_shape_to_np_array(shape) for shape in shapes])
+            predict_loop = cls._time(lambda: [_predict_orientation_per_image(points, n)
+                                              for points, n in zip(landmarks, n_rotations)])
+            predict_batch = cls._time(lambda: predict_orientations_from_landmarks(landmarks, n_rotations))
+
+            print('%-10d  %20.3f  %20.3f  %20.3f  %20.3f' % (batch_size, convert_loop, convert, predict_loop,
+                                                             predict_batch))
@@ -0,0 +1,39 @@
+"""Micro-benchmark comparing the lossless quarter-turn rotation of `utils.rotate_image` with the affine
+transformation (`cv2.warpAffine`) it replaced for multiples of 90 degrees, on large images."""
+import timeit
+
+import numpy as np
+
+from faceorienter import utils
+
+
+class BenchmarkRotation(object):
+    # (width, height) of the benchmarked images (~2, ~12 and ~24 megapixels)
+    sizes = [(1920, 1080), (4032, 3024), (6000, 4000)]
+    angles = [90, 180, 270]
+    repeat = 5
+
+    @classmethod
+    def _time(cls, func):
+        """Returns the best of `repeat` runs (in milliseconds)"""
+        return min(timeit.repeat(func, number=1, repeat=cls.repeat)) * 1000
+
+    @classmethod
+    def run(cls):
+        print('%-12s %5s  %12s  %12s  %16s  %16s' % ('size', 'angle', 'affine (ms)', 'view (ms)', 'contiguous (ms)',
+                                                   'view copy (ms)'))
+        print('-' * 84)
+
+        for width, height in cls.sizes:
+            img = np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+
+            for angle in cls.angles:
+                # `view` is what `rotate_image` returns by default, `contiguous` is a contiguous copy made by
+                # `cv2.rotate` (as required by dlib or for encoding) and `view copy` is the same copy made by numpy
+                affine = cls._time(lambda: utils._rotate_image_affine(img, angle))
+                view = cls._time(lambda: utils.rotate_image(img, angle))
+                contiguous = cls._time(lambda: utils.rotate_image(img, angle, contiguous=True))
+                view_copy = cls._time(lambda: np.ascontiguousarray(utils.rotate_image(img, angle)))
+
+                print('%-12s %5d  %12.2f  %12.3f  %16.2f  %16.2f' % ('%dx%d' % (width, height), angle, affine, view,
+                                                                     contiguous, view_copy))
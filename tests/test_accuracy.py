@@ -1,6 +1,11 @@
 """Tests the accuracy using the Helen-1 dataset (from vision.caltech.edu). Automatically downloads and prepares the
-dataset (and cleans up afterwords)."""
+dataset (and cleans up afterwords).
+
+Optionally, a list of maximum detection sizes can be supplied (e.g. `python -m tests accuracy full 1000 500 250`). The
+test is then repeated for each of them, and a report comparing accuracy and throughput is printed at the end, to find
+out where downscaled detection starts to degrade accuracy."""
 import os
+import time
 from pprint import pprint
 from shutil import rmtree
 from tarfile import TarFile
@@ -9,7 +14,7 @@ from urllib import request
 
 import cv2
 
-from faceorienter import FaceOrienter
+from faceorienter import predict_orientations
 from faceorienter.utils import rotate_image
 
 
@@ -49,7 +54,7 @@ class TestAccuracy(object):
         return images
 
     @classmethod
-    def _make_predictions(cls, images):
+    def _make_predictions(cls, images, max_detection_side=None):
         confusion_matrix = {
             'up': {'up': 0, 'down': 0, 'left': 0, 'right': 0},
             'down': {'up': 0, 'down': 0, 'left': 0, 'right': 0},
@@ -57,15 +62,17 @@ class TestAccuracy(object):
             'right': {'up': 0, 'down': 0, 'left': 0, 'right': 0}
         }
 
+        actual_classes = [actual_class for actual_class, img_files in images.items() for _ in img_files]
+        img_paths = (os.path.join(cls.dataset_dir, img_file) for img_files in images.values() for img_file in img_files)
+
         count = 0
-        total = len(os.listdir(cls.dataset_dir))
-        for actual_class, img_files in images.items():
-            for img_file in img_files:
-                predicted_class = FaceOrienter(os.path.join(cls.dataset_dir, img_file)).predict_orientation()
-                confusion_matrix[predicted_class][actual_class] += 1
-                count += 1
-                if count % 100 == 0:
-                    print('predicted %d out of %d' % (count, total))
+        total = len(actual_classes)
+        for i, predicted_class in predict_orientations(img_paths, ordered=False, chunksize=8,
+                                                        max_detection_side=max_detection_side):
+            confusion_matrix[predicted_class][actual_classes[i]] += 1
+            count += 1
+            if count % 100 == 0:
+                print('predicted %d out of %d' % (count, total))
 
         return confusion_matrix
 
@@ -82,20 +89,31 @@ class TestAccuracy(object):
         rmtree(cls.dataset_dir)
 
     @classmethod
-    def run(cls):
+    def run(cls, max_detection_sides=(None,)):
         print('Downloading dataset to `%s`...' % cls.dataset_tar_local)
         cls._download_dataset()
 
         print('Extracting dataset to `%s` and creating rotated copies of images...' % cls.dataset_dir)
         images = cls._prepare_dataset()
-
-        print('Starting prediction...')
-        confusion_matrix = cls._make_predictions(images)
-        accuracy = cls._calculate_accuracy(confusion_matrix)
-
-        print('Confusion Matrix\n' + '-' * 20)
-        pprint(confusion_matrix)
-
-        print('\nAccuracy: %f%%' % accuracy)
+        total = sum(len(img_files) for img_files in images.values())
+
+        report = []
+        for max_detection_side in max_detection_sides:
+            print('Starting prediction (max. detection side: %s)...' % (max_detection_side or 'full resolution'))
+            start = time.time()
+            confusion_matrix = cls._make_predictions(images, max_detection_side)
+            elapsed = time.time() - start
+            accuracy = cls._calculate_accuracy(confusion_matrix)
+
+            print('Confusion Matrix\n' + '-' * 20)
+            pprint(confusion_matrix)
+
+            print('\nAccuracy: %f%%' % (accuracy * 100))
+            report.append((max_detection_side, accuracy, total / elapsed))
+
+        if len(report) > 1:
+            print('\nmax. detection side  accuracy  images/s\n' + '-' * 40)
+            for max_detection_side, accuracy, throughput in report:
+                print('%-20s  %7.2f%%  %8.2f' % (max_detection_side or 'full', accuracy * 100, throughput))
 
         cls._clean_up()
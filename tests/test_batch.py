@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+import cv2
+
+from faceorienter import predict_orientations
+
+
+class TestBatch(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        res_dir = os.path.join(os.path.dirname(__file__), 'res')
+        cls.orientations = ['left', 'right', 'up', 'down']
+        cls.images = [os.path.join(res_dir, 'gates_%s.jpg' % orientation) for orientation in cls.orientations]
+
+    def test_predict_orientations_ordered(self):
+        """Checks if results are streamed back in input order, regardless of the number of workers"""
+        for workers in (1, 2):
+            results = list(predict_orientations(self.images, workers=workers))
+            self.assertEqual(results, list(enumerate(self.orientations)))
+
+    def test_predict_orientations_unordered(self):
+        """Checks if all results are returned when streaming them back as they complete"""
+        results = predict_orientations(self.images, workers=2, ordered=False)
+        self.assertEqual(sorted(results), list(enumerate(self.orientations)))
+
+    def test_predict_orientations_mixed_inputs(self):
+        """Checks if paths, encoded images and decoded images can be mixed in a single batch"""
+        with open(self.images[1], 'rb') as img_fp:
+            images = [self.images[0], img_fp.read(), cv2.imread(self.images[2])]
+
+        results = list(predict_orientations(images, workers=2))
+        self.assertEqual(results, list(enumerate(self.orientations[:3])))
+
+    def test_start_method_not_fixed(self):
+        """Checks if processing images in parallel doesn't fix the process-wide start method (in a fresh interpreter,
+        in which it hasn't been set yet)"""
+        code = ('import multiprocessing; from faceorienter import predict_orientations; '
+                'list(predict_orientations(%r, workers=2)); print(multiprocessing.get_start_method(allow_none=True)); '
+                'multiprocessing.set_start_method("spawn")' % self.images[:2])
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=os.path.dirname(os.path.dirname(__file__))).decode().strip()
+        self.assertEqual(output, 'None')
@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from tempfile import mkdtemp
+from shutil import rmtree
+from unittest import TestCase
+
+import numpy as np
+
+from faceorienter import FaceOrienter
+from faceorienter.cache import LRUCache, SqliteCache
+
+
+class TestCache(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        rmtree(cls.tmp_dir)
+
+    def _test_cache(self, cache):
+        """Checks the hit/miss counters, size eviction and expiry of a cache with max. size 2 and a TTL of 0.5s"""
+        self.assertEqual(cache.get('a'), None)
+        cache.set('a', {'orientation': 'up'})
+        cache.set('b', {'orientation': 'down'})
+        self.assertEqual(cache.get('a'), {'orientation': 'up'})
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        cache.set('c', {'orientation': 'left'})
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('c'), {'orientation': 'left'})
+
+        time.sleep(0.6)
+        self.assertEqual(cache.get('c'), None)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_lru_cache(self):
+        """Checks the in-memory cache (which evicts the least recently used entry)"""
+        cache = LRUCache(max_size=2, ttl=0.5)
+        self._test_cache(cache)
+
+        cache.set('a', {})
+        cache.set('b', {})
+        cache.get('a')
+        cache.set('c', {})
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), {})
+
+    def test_sqlite_cache(self):
+        """Checks the on-disk cache (which evicts the oldest entry), and if entries are shared between instances"""
+        path = os.path.join(self.tmp_dir, 'cache.sqlite')
+        self._test_cache(SqliteCache(path, max_size=2, ttl=0.5))
+
+        SqliteCache(path).set('d', {'orientation': 'right'})
+        self.assertEqual(SqliteCache(path).get('d'), {'orientation': 'right'})
+
+    def test_cached_prediction(self):
+        """Checks if a FaceOrienter restores predictions from the cache, separately for different options"""
+        with open(os.path.join(os.path.dirname(__file__), 'res', 'gates_left.jpg'), 'rb') as img_fp:
+            img_bytes = img_fp.read()
+
+        cache = LRUCache()
+        fo = FaceOrienter.from_bytes(img_bytes, cache=cache)
+        fo_cached = FaceOrienter.from_bytes(img_bytes, cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(fo_cached.predict_orientation(), 'left')
+        self.assertEqual(fo_cached.n_rotations, fo.n_rotations)
+        self.assertTrue(np.array_equal(fo_cached.landmarks, fo.landmarks))
+
+        FaceOrienter.from_bytes(img_bytes, cache=cache, detection_strategy='best')
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        # The padding of the region of interest changes the region that is searched
+        for roi_padding in (0.5, 1., 1.):
+            FaceOrienter.from_bytes(img_bytes, cache=cache, roi=fo.get_original_face_rect(), roi_padding=roi_padding)
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+        # Whether a face was found in the region of interest is cached as well
+        self.assertTrue(FaceOrienter.from_bytes(img_bytes, cache=cache, roi=fo.get_original_face_rect(),
+                                                roi_padding=1.).roi_hit)
+        self.assertEqual((cache.hits, cache.misses), (3, 4))
+
+    def test_concurrent_counters(self):
+        """Checks if no hits/misses are lost when a cache is shared by many threads"""
+        cache = LRUCache()
+        cache.set('a', {})
+
+        def get_many():
+            for i in range(2000):
+                cache.get('a' if i % 2 == 0 else 'b')
+
+        threads = [threading.Thread(target=get_many) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((cache.hits, cache.misses), (8000, 8000))
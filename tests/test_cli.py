@@ -0,0 +1,123 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from faceorienter import FaceOrienter
+from faceorienter.cli import get_output_path, iter_images, main
+
+
+class TestCLI(TestCase):
+    def setUp(self):
+        res_dir = os.path.join(os.path.dirname(__file__), 'res')
+        self.tmp_dir = mkdtemp()
+        self.input_dir = os.path.join(self.tmp_dir, 'input')
+        self.orientations = {}
+        for orientation in ('left', 'right', 'up', 'down'):
+            path = os.path.join(self.input_dir, orientation, 'gates.jpg')
+            os.makedirs(os.path.dirname(path))
+            shutil.copy(os.path.join(res_dir, 'gates_%s.jpg' % orientation), path)
+            self.orientations[path] = orientation
+
+        # Not an image (should be ignored when processing a directory)
+        with open(os.path.join(self.input_dir, 'notes.txt'), 'w') as notes:
+            notes.write('not an image')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _read_results(self, results_path):
+        with open(results_path, 'r') as results_file:
+            return [json.loads(line) for line in results_file]
+
+    def test_iter_images(self):
+        """Checks if directories, glob patterns and manifests are listed correctly"""
+        expected = sorted((path, os.path.relpath(path, self.input_dir)) for path in self.orientations)
+        self.assertEqual(list(iter_images(self.input_dir)), expected)
+        self.assertEqual(sorted(iter_images(os.path.join(self.input_dir, '**', '*.jpg'))), expected)
+
+        manifest_path = os.path.join(self.input_dir, 'manifest.jsonl')
+        with open(manifest_path, 'w') as manifest:
+            for path, relative_path in expected:
+                manifest.write(json.dumps({'path': relative_path}) + '\n')
+        self.assertEqual(list(iter_images(manifest_path)), expected)
+
+    def test_process_directory(self):
+        """Checks if all images are processed, and fixed images are written to the output directory"""
+        output_dir = os.path.join(self.tmp_dir, 'output')
+        results_path = os.path.join(self.tmp_dir, 'results.jsonl')
+        main([self.input_dir, '--output-dir', output_dir, '--results', results_path, '--workers', '2'])
+
+        results = self._read_results(results_path)
+        self.assertEqual({result['path']: result['orientation'] for result in results}, self.orientations)
+        for result in results:
+            self.assertEqual(FaceOrienter(result['output_path']).predict_orientation(), 'down')
+
+    def test_resume(self):
+        """Checks if resuming skips images that have already been processed"""
+        results_path = os.path.join(self.tmp_dir, 'results.jsonl')
+        main([self.input_dir, '--results', results_path, '--workers', '2'])
+
+        # Simulate a crash, after which only the first result (and part of the second one) were written
+        results = self._read_results(results_path)
+        with open(results_path, 'w') as results_file:
+            results_file.write(json.dumps(results[0]) + '\n' + json.dumps(results[1])[:10])
+
+        main([self.input_dir, '--results', results_path, '--workers', '2', '--resume'])
+        results_resumed = self._read_results(results_path)
+        self.assertEqual(results_resumed[0], results[0])
+        self.assertEqual(sorted(result['path'] for result in results_resumed), sorted(self.orientations))
+
+    def test_start_method_not_fixed(self):
+        """Checks if processing images doesn't fix the process-wide start method (in a fresh interpreter, in which it
+        hasn't been set yet)"""
+        code = ('import multiprocessing; from faceorienter.cli import iter_images, process_images; '
+                'list(process_images(iter_images(%r), workers=2)); '
+                'print(multiprocessing.get_start_method(allow_none=True)); '
+                'multiprocessing.set_start_method("spawn")' % self.input_dir)
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=os.path.dirname(os.path.dirname(__file__))).decode().strip()
+        self.assertEqual(output, 'None')
+
+    def test_output_path_outside_output_dir(self):
+        """Checks if manifest entries whose output path would be outside of the output directory are rejected"""
+        output_dir = os.path.join(self.tmp_dir, 'output')
+        self.assertEqual(get_output_path(output_dir, 'a/b.jpg'),
+                         os.path.join(os.path.realpath(output_dir), 'a', 'b.jpg'))
+        for relative_path in ('../escaped.jpg', 'a/../../escaped.jpg', os.path.realpath(self.tmp_dir), '.'):
+            self.assertRaises(ValueError, get_output_path, output_dir, relative_path)
+
+        # Absolute paths are placed inside the output directory
+        image_path = os.path.join(self.input_dir, 'up', 'gates.jpg')
+        manifest_path = os.path.join(self.input_dir, 'manifest.jsonl')
+        with open(manifest_path, 'w') as manifest:
+            manifest.write(json.dumps({'path': 'up/gates.jpg'}) + '\n')
+            manifest.write(json.dumps({'path': '../input/up/gates.jpg'}) + '\n')
+            manifest.write(json.dumps({'path': image_path}) + '\n')
+
+        results_path = os.path.join(self.tmp_dir, 'results.jsonl')
+        main([manifest_path, '--output-dir', output_dir, '--results', results_path, '--workers', '1'])
+
+        results = self._read_results(results_path)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(sum('error' in result for result in results), 1)
+
+        # The escaping entry would have overwritten its own input image
+        self.assertEqual(FaceOrienter(image_path).predict_orientation(), 'up')
+        for result in results:
+            if 'error' in result:
+                self.assertIn('outside of the output directory', result['error'])
+            else:
+                self.assertTrue(os.path.realpath(result['output_path']).startswith(os.path.realpath(output_dir)))
+
+    def test_memory_budget(self):
+        """Checks if the peak memory of each image is reported in low-memory mode"""
+        results_path = os.path.join(self.tmp_dir, 'results.jsonl')
+        main([self.input_dir, '--results', results_path, '--workers', '1', '--memory-budget', str(64 * 1024 * 1024)])
+
+        results = self._read_results(results_path)
+        self.assertEqual({result['path']: result['orientation'] for result in results}, self.orientations)
+        self.assertTrue(all(result['peak_memory'] > 0 for result in results))
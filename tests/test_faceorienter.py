@@ -3,8 +3,12 @@ from tempfile import mktemp
 from unittest import TestCase
 
 import cv2
+import numpy as np
 
-from faceorienter import FaceOrienter
+from faceorienter import FaceOrienter, metrics, predict_orientations_from_landmarks
+from faceorienter import faceorienter as faceorienter_module
+from faceorienter.faceorienter import vote_orientation
+from .test_utils import add_exif_orientation
 
 
 class TestFaceOrienter(TestCase):
@@ -28,15 +32,17 @@ class TestFaceOrienter(TestCase):
 
     def test_init_image_without_face(self):
         """Tests the behavior when an image is supplied that does not contain a face"""
-        # Test using an image containing black square (shouldn't fail, but just make a random guess)
+        # Test using an image containing black square (shouldn't fail, but leave the image as it is)
         try:
             fo = FaceOrienter(os.path.join(os.path.dirname(__file__), 'res', 'black_square.jpg'))
         except Exception as e:
             self.fail('An exception was raised unexpectedly: \n%s.%s: %s' %
                       (e.__class__.__module__, e.__class__.__name__, str(e)))
 
-        # No landmarks should have been found
+        # No landmarks should have been found, so the orientation is unknown
         self.assertEqual(fo.landmarks, None)
+        self.assertEqual(fo.predict_orientation_with_confidence(), (None, 0.))
+        self.assertEqual(fo.predict_orientation(), 'down')
 
     def test_predict_orientation(self):
         """Checks if predicting the orientation works using very clear, easy-to-predict, frontal-view portrait images"""
@@ -54,3 +60,232 @@ class TestFaceOrienter(TestCase):
             # (TODO: not a very good approach)
             self.assertEqual(FaceOrienter(img_tmp).predict_orientation(), 'down')
             os.remove(img_tmp)
+
+    def test_init_from_memory(self):
+        """Checks if creating the object from bytes or an array yields the same results as creating it from a file"""
+        for orientation, img_path in self.gates_images.items():
+            with open(img_path, 'rb') as img_fp:
+                self.assertEqual(orientation, FaceOrienter.from_bytes(img_fp.read()).predict_orientation())
+            self.assertEqual(orientation, FaceOrienter.from_array(cv2.imread(img_path)).predict_orientation())
+
+        # Bytes that are not a valid image should behave like a file that is not a valid image
+        self.assertRaises(cv2.error, FaceOrienter.from_bytes, b'not an image')
+
+    def test_fix_orientation_in_memory(self):
+        """Checks if fixing the orientation in memory yields the same result as fixing it on disk"""
+        for img_path in self.gates_images.values():
+            fo = FaceOrienter(img_path)
+            img_tmp = mktemp(suffix=os.path.splitext(img_path)[1])
+            fo.fix_orientation(img_tmp)
+            with open(img_tmp, 'rb') as img_tmp_fp:
+                self.assertEqual(img_tmp_fp.read(), fo.get_fixed_image_bytes(os.path.splitext(img_path)[1]))
+            os.remove(img_tmp)
+
+            self.assertTrue(np.array_equal(fo.get_fixed_image(), cv2.imdecode(
+                np.frombuffer(fo.get_fixed_image_bytes('.png'), dtype=np.uint8), cv2.IMREAD_COLOR)))
+
+    def test_downscaled_detection(self):
+        """Checks if detecting faces on a downscaled copy yields the same orientation, and landmarks that are mapped
+        back to (approximately) the same positions in the original image"""
+        for orientation, img_path in self.gates_images.items():
+            fo = FaceOrienter(img_path)
+            fo_downscaled = FaceOrienter(img_path, max_detection_side=200)
+
+            self.assertEqual(orientation, fo_downscaled.predict_orientation())
+            self.assertEqual(fo.n_rotations, fo_downscaled.n_rotations)
+            self.assertLessEqual(np.abs(fo.landmarks - fo_downscaled.landmarks).max(), 8)
+
+    def test_downscaled_detection_vs_full_resolution(self):
+        """Compares downscaled detection to full resolution detection on upscaled (1000px) copies of the fixtures: down
+        to a maximum side of 150 pixels, orientations are the same and landmarks deviate by less than 4% of the face
+        size (see the README for where accuracy starts to degrade)"""
+        for orientation, img_path in self.gates_images.items():
+            img = cv2.imread(img_path)
+            scale = 1000 / max(img.shape[:2])
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+            fo = FaceOrienter.from_array(img)
+            self.assertEqual(orientation, fo.predict_orientation())
+            face_size = np.ptp(fo.landmarks, axis=0).max()
+
+            for max_detection_side in (800, 400, 200, 150):
+                fo_downscaled = FaceOrienter.from_array(img, max_detection_side=max_detection_side)
+                self.assertEqual(orientation, fo_downscaled.predict_orientation())
+                self.assertEqual(fo.n_rotations, fo_downscaled.n_rotations)
+                self.assertLessEqual(np.abs(fo.landmarks - fo_downscaled.landmarks).max(), 0.04 * face_size)
+
+    def test_best_detection_strategy(self):
+        """Checks if detecting faces in all orientations yields the same results as the default strategy"""
+        for orientation, img_path in self.gates_images.items():
+            fo = FaceOrienter(img_path, detection_strategy='best')
+            self.assertEqual(orientation, fo.predict_orientation())
+            self.assertEqual(FaceOrienter(img_path).n_rotations, fo.n_rotations)
+
+        fo = FaceOrienter(os.path.join(os.path.dirname(__file__), 'res', 'black_square.jpg'), detection_strategy='best')
+        self.assertEqual(fo.landmarks, None)
+
+        self.assertRaises(ValueError, FaceOrienter, self.gates_images['up'], detection_strategy='unknown')
+
+    def test_confidence(self):
+        """Checks the confidence of predictions, voting across multiple faces and escalation of uncertain predictions"""
+        for orientation, img_path in self.gates_images.items():
+            fo = FaceOrienter(img_path)
+            predicted_orientation, confidence = fo.predict_orientation_with_confidence()
+            self.assertEqual(predicted_orientation, orientation)
+            self.assertTrue(0.5 < confidence <= 1)
+            self.assertEqual(fo.all_landmarks.shape, (1, 5, 2))
+            self.assertEqual(fo.face_scores.shape, (1,))
+
+        # Two faces next to each other: both vote for the same orientation
+        img = cv2.imread(self.gates_images['left'])
+        fo = FaceOrienter.from_array(np.concatenate([img, img], axis=0))
+        self.assertEqual(fo.predict_orientation_with_confidence()[0], 'left')
+        self.assertEqual(fo.all_landmarks.shape, (2, 5, 2))
+        self.assertTrue(np.all(np.diff(fo.face_scores) <= 0))
+
+        # Disagreeing faces lower the confidence, and the face with the higher score wins
+        landmarks = np.stack([fo.landmarks, fo.landmarks[:, ::-1]])
+        orientations = predict_orientations_from_landmarks(landmarks, 0)
+        orientation, confidence = vote_orientation(landmarks, 0, [2., 1.])
+        self.assertEqual(orientation, orientations[0])
+        self.assertLess(confidence, vote_orientation(landmarks[:1], 0, [2.])[1])
+        self.assertEqual(vote_orientation(np.zeros((0, 5, 2)), 0, []), (None, 0.))
+
+        # Uncertain predictions are escalated (but nothing can be found in a black square)
+        was_enabled = metrics.is_enabled()
+        metrics.reset()
+        metrics.enable()
+        try:
+            fo = FaceOrienter(os.path.join(os.path.dirname(__file__), 'res', 'black_square.jpg'),
+                              escalation_threshold=0.5)
+            self.assertEqual(fo.predict_orientation_with_confidence(), (None, 0.))
+            FaceOrienter(self.gates_images['up'], escalation_threshold=0.5)
+            self.assertEqual(metrics.snapshot()['counters'].get('escalations'), 1)
+        finally:
+            if not was_enabled:
+                metrics.disable()
+            metrics.reset()
+
+    def test_escalation_max_pixels(self):
+        """Checks if images are downscaled before escalation (to bound its memory usage), and if the landmarks found
+        by escalation are mapped back to the original resolution"""
+        max_pixels = faceorienter_module.ESCALATION_MAX_PIXELS
+        self.addCleanup(setattr, faceorienter_module, 'ESCALATION_MAX_PIXELS', max_pixels)
+        faceorienter_module.ESCALATION_MAX_PIXELS = 200 * 200
+
+        # A face that is too small to be found without escalation, on a canvas larger than the maximum
+        img = cv2.imread(self.gates_images['left'])
+        img = cv2.resize(img, None, fx=120. / max(img.shape[:2]), fy=120. / max(img.shape[:2]),
+                         interpolation=cv2.INTER_AREA)
+        canvas = np.zeros((300, 300, 3), dtype=np.uint8)
+        canvas[50:50 + img.shape[0], 60:60 + img.shape[1]] = img
+
+        was_enabled = metrics.is_enabled()
+        metrics.reset()
+        metrics.enable()
+        try:
+            fo = FaceOrienter.from_array(canvas, escalation_threshold=0.5)
+            self.assertEqual(fo.predict_orientation(), 'left')
+            self.assertEqual(metrics.snapshot()['counters'].get('escalations'), 1)
+            self.assertEqual(metrics.snapshot()['stages']['downscale']['count'], 1)
+        finally:
+            if not was_enabled:
+                metrics.disable()
+            metrics.reset()
+
+        left, top, right, bottom = fo.get_original_face_rect()
+        self.assertTrue(60 <= left < right <= 60 + img.shape[1] and 50 <= top < bottom <= 50 + img.shape[0])
+        for x, y in fo.get_original_landmarks():
+            self.assertTrue(left <= x <= right and top <= y <= bottom)
+
+    def test_roi(self):
+        """Checks if faces are found in a region of interest first (falling back to the whole image on a miss), with
+        the same results as when searching the whole image"""
+        img = np.zeros((1200, 1600, 3), dtype=np.uint8)
+        img[600:999, 1000:1399] = cv2.imread(self.gates_images['right'])
+        fo = FaceOrienter.from_array(img)
+        self.assertEqual(fo.roi_hit, None)
+
+        # The face's bounding box can be passed on as region of interest
+        fo_roi = FaceOrienter.from_array(img, roi=fo.get_original_face_rect())
+        self.assertTrue(fo_roi.roi_hit)
+        self.assertEqual(fo_roi.predict_orientation(), 'right')
+        self.assertEqual(fo_roi.n_rotations, fo.n_rotations)
+        self.assertLessEqual(np.abs(fo.get_original_landmarks() - fo_roi.get_original_landmarks()).max(), 8)
+        self.assertLessEqual(np.abs(fo.get_original_face_rect() - fo_roi.get_original_face_rect()).max(), 16)
+
+        # Also at a reduced resolution, and for encoded images
+        fo_roi = FaceOrienter.from_bytes(cv2.imencode('.jpg', img)[1].tobytes(), roi=fo.get_original_face_rect(),
+                                         max_detection_side=800)
+        self.assertTrue(fo_roi.roi_hit)
+        self.assertLessEqual(np.abs(fo.get_original_landmarks() - fo_roi.get_original_landmarks()).max(), 8)
+
+        # Regions without faces fall back to the whole image
+        fo_roi = FaceOrienter.from_array(img, roi=(0, 0, 200, 200))
+        self.assertFalse(fo_roi.roi_hit)
+        self.assertEqual(fo_roi.predict_orientation(), 'right')
+
+    def test_memory_budget(self):
+        """Checks if large images are processed in low-memory mode with the same results, and the peak memory is
+        measured (if requested)"""
+        img = cv2.resize(cv2.imread(self.gates_images['up']), (2000, 2000))
+        fo = FaceOrienter.from_array(img)
+        self.assertEqual(fo.peak_memory, None)
+
+        # The peak memory is only traced if requested
+        self.assertEqual(FaceOrienter.from_array(img, memory_budget=32 * 1024 * 1024).peak_memory, None)
+
+        for ext in ('.jpg', '.png'):
+            img_bytes = cv2.imencode(ext, img)[1].tobytes()
+            fo_low_memory = FaceOrienter.from_bytes(img_bytes, memory_budget=32 * 1024 * 1024, trace_memory=True)
+            self.assertEqual(fo_low_memory.predict_orientation(), 'up')
+            self.assertLessEqual(np.abs(fo.get_original_landmarks() - fo_low_memory.get_original_landmarks()).max(), 16)
+
+            # The image isn't decoded in color for detection (PNGs are decoded in grayscale, JPEGs at a reduced size)
+            self.assertLess(fo_low_memory.peak_memory, img.size / 2)
+
+            # The image is decoded again (and rotated in place) to fix its orientation
+            img_decoded = cv2.imdecode(np.frombuffer(img_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+            np.testing.assert_array_equal(fo_low_memory.get_fixed_image(), cv2.rotate(img_decoded, cv2.ROTATE_180))
+            self.assertGreaterEqual(fo_low_memory.peak_memory, img.size)
+
+        # A tighter budget reduces the resolution further
+        fo_low_memory = FaceOrienter.from_array(img, memory_budget=8 * 1024 * 1024)
+        self.assertEqual(fo_low_memory.predict_orientation(), 'up')
+
+    def test_trust_exif(self):
+        """Checks if the EXIF orientation is trusted (and no faces are detected), if requested"""
+        with open(self.gates_images['right'], 'rb') as img_fp:
+            jpeg = img_fp.read()
+
+        # Orientation 6 means the image has to be rotated by 90 degrees clockwise (which the decoder does)
+        for trust_exif in (False, True):
+            fo = FaceOrienter.from_bytes(add_exif_orientation(jpeg, 6), trust_exif=trust_exif)
+            self.assertEqual(fo.exif_orientation, 6)
+            self.assertEqual(fo.predict_orientation(), 'down')
+            self.assertEqual(fo.landmarks is None, trust_exif)
+
+        # Orientation 1 is not trusted, since many encoders write it by default
+        fo = FaceOrienter.from_bytes(add_exif_orientation(jpeg, 1), trust_exif=True)
+        self.assertEqual(fo.predict_orientation(), 'right')
+
+    def test_fix_orientation_lossless(self):
+        """Checks if fixing the orientation losslessly yields a correctly oriented JPEG (this falls back to re-encoding
+        if jpegtran is not installed, or the image dimensions aren't a multiple of the JPEG block size)"""
+        for img_path in self.gates_images.values():
+            img_fixed_bytes = FaceOrienter(img_path).get_fixed_image_bytes('.jpg', lossless=True)
+            self.assertEqual(FaceOrienter.from_bytes(img_fixed_bytes).predict_orientation(), 'down')
+
+    def test_predict_orientations_from_landmarks(self):
+        """Checks if predicting the orientations of many faces at once yields the same results as predicting them
+        separately"""
+        face_orienters = [FaceOrienter(img_path) for img_path in self.gates_images.values()]
+        landmarks = np.stack([fo.landmarks for fo in face_orienters])
+        n_rotations = np.array([fo.n_rotations for fo in face_orienters])
+
+        self.assertEqual(predict_orientations_from_landmarks(landmarks, n_rotations).tolist(),
+                         list(self.gates_images.keys()))
+
+        # Each rotation of the faces should rotate the predictions accordingly
+        self.assertEqual(predict_orientations_from_landmarks(landmarks, n_rotations + 1).tolist(),
+                         [{'down': 'right', 'right': 'up', 'up': 'left', 'left': 'down'}[orientation]
+                          for orientation in self.gates_images.keys()])
@@ -0,0 +1,88 @@
+import os
+import subprocess
+import sys
+import tracemalloc
+from unittest import TestCase
+
+import numpy as np
+
+from faceorienter import FaceOrienter, metrics
+from faceorienter.server import app, routes
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.was_enabled = metrics.is_enabled()
+        metrics.enable()
+        metrics.reset()
+
+    def tearDown(self):
+        if not self.was_enabled:
+            metrics.disable()
+
+    def test_stages_and_counters(self):
+        """Checks if all stages are recorded, and hooks are called"""
+        events = []
+
+        def hook(kind, name, value):
+            events.append((kind, name))
+
+        metrics.add_hook(hook)
+        try:
+            res_dir = os.path.join(os.path.dirname(__file__), 'res')
+            FaceOrienter(os.path.join(res_dir, 'gates_left.jpg')).get_fixed_image_bytes()
+            FaceOrienter(os.path.join(res_dir, 'black_square.jpg'))
+        finally:
+            metrics.remove_hook(hook)
+
+        snapshot = metrics.snapshot()
+        for stage in ('read', 'decode', 'grayscale', 'detect', 'rotate', 'landmarks', 'encode'):
+            self.assertTrue(snapshot['stages'][stage]['count'] > 0, stage)
+            self.assertTrue(('stage', stage) in events, stage)
+
+        # The image without a face is rotated three times, detection runs four times
+        self.assertEqual(snapshot['counters']['images'], 2)
+        self.assertEqual(snapshot['counters']['no_face'], 1)
+        self.assertTrue(snapshot['counters']['rotation_attempts'] >= 3)
+
+    def test_disabled(self):
+        """Checks if nothing is recorded while instrumentation is disabled"""
+        metrics.disable()
+        FaceOrienter(os.path.join(os.path.dirname(__file__), 'res', 'gates_up.jpg'))
+        self.assertEqual(metrics.snapshot(), {'stages': {}, 'counters': {}})
+
+    def test_trace_memory(self):
+        """Checks if the peak memory allocated within a block is measured (also for nested blocks)"""
+        with metrics.trace_memory() as outer:
+            with metrics.trace_memory() as inner:
+                buf = np.ones(4 * 1024 * 1024, dtype=np.uint8)
+                del buf
+            buf = np.ones(1024 * 1024, dtype=np.uint8)
+
+        self.assertGreaterEqual(inner['peak'], 4 * 1024 * 1024)
+        self.assertGreaterEqual(outer['peak'], inner['peak'])
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_metrics_endpoint(self):
+        """Checks if the metrics are exposed in the Prometheus text format"""
+        client = app.test_client()
+        FaceOrienter(os.path.join(os.path.dirname(__file__), 'res', 'gates_up.jpg'))
+
+        response = client.get('/metrics')
+        text = response.get_data(as_text=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        self.assertTrue('faceorienter_stage_duration_seconds_count{stage="detect"}' in text)
+        self.assertTrue('faceorienter_images_total' in text)
+        self.assertTrue('faceorienter_queue_depth 0' in text)
+        self.assertTrue('faceorienter_worker_pid %d' % os.getpid() in text)
+        if sys.platform != 'win32':
+            self.assertTrue('faceorienter_max_rss_bytes' in text)
+
+    def test_not_enabled_by_import(self):
+        """Checks if importing the server package doesn't enable instrumentation (only running the server does)"""
+        output = subprocess.check_output([sys.executable, '-c', 'import faceorienter.server.routes; '
+                                                                'from faceorienter import metrics; '
+                                                                'print(metrics.is_enabled())'],
+                                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(output.strip(), b'False')
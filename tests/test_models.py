@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import mkdtemp
+from shutil import rmtree
+from unittest import TestCase
+
+from faceorienter import FaceOrienter, models
+
+
+class TestModels(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = mkdtemp()
+        cls.project_dir = os.path.dirname(os.path.dirname(__file__))
+
+    @classmethod
+    def tearDownClass(cls):
+        rmtree(cls.tmp_dir)
+
+    def _run_python(self, code, **env):
+        """Runs code in a fresh interpreter (so that no models are loaded yet) and returns its output"""
+        return subprocess.check_output([sys.executable, '-c', code], cwd=self.project_dir,
+                                       env=dict(os.environ, **env)).decode().strip()
+
+    def test_lazy_loading(self):
+        """Checks if the models are loaded upon first use (not upon import), and only once across threads"""
+        self.assertEqual(self._run_python('import faceorienter, sys; from faceorienter import models; '
+                                          'print(models.is_loaded(), "dlib" in sys.modules)'), 'False False')
+
+        with ThreadPoolExecutor(4) as executor:
+            detectors = list(executor.map(lambda _: models.get_face_detector(), range(8)))
+        self.assertTrue(all(detector is detectors[0] for detector in detectors))
+
+        models.warmup()
+        self.assertTrue(models.is_loaded())
+
+    def test_export_models(self):
+        """Checks if exported (pre-serialized) models are loaded from the configured directory and yield the same
+        predictions"""
+        model_dir = os.path.join(self.tmp_dir, 'model')
+        models.export_models(model_dir)
+        self.assertEqual(sorted(os.listdir(model_dir)), sorted([models.FACE_DETECTOR_FILE,
+                                                                models.LANDMARK_DETECTOR_FILE]))
+
+        img_path = os.path.join(os.path.dirname(__file__), 'res', 'gates_left.jpg')
+        output = self._run_python('from faceorienter import FaceOrienter, models; '
+                                  'print(models._find_model(models.FACE_DETECTOR_FILE)); '
+                                  'print(FaceOrienter(%r).predict_orientation())' % img_path,
+                                  FACEORIENTER_MODEL_DIR=model_dir)
+        self.assertEqual(output.split('\n'), [os.path.join(model_dir, models.FACE_DETECTOR_FILE),
+                                              FaceOrienter(img_path).predict_orientation()])
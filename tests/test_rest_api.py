@@ -1,9 +1,15 @@
+import io
 import os
+import threading
 from tempfile import mktemp
 from unittest import TestCase
 
+import cv2
+import numpy as np
+
 from faceorienter import FaceOrienter
 from faceorienter.server import app, routes
+from faceorienter.server.scheduler import InferenceScheduler
 
 
 class TestRestAPI(TestCase):
@@ -26,3 +32,186 @@ class TestRestAPI(TestCase):
 
         # Check if equal
         self.assertEqual(result_local, response.data)
+
+    def test_fix_orientation_other_formats_via_rest_api(self):
+        """Checks if uploads in formats other than JPEG/PNG/WebP are returned in their own format by default"""
+        client = app.test_client()
+        client.testing = True
+        img = cv2.imread(os.path.join(os.path.dirname(__file__), 'res', 'gates_up.jpg'))
+
+        for ext, content_type in (('.bmp', 'image/bmp'), ('.tiff', 'image/tiff')):
+            response = client.post('/orient', content_type='multipart/form-data',
+                                   data={'image': (io.BytesIO(cv2.imencode(ext, img)[1].tobytes()), 'gates_up' + ext)})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content_type, content_type)
+            np.testing.assert_array_equal(cv2.imdecode(np.frombuffer(response.data, dtype=np.uint8), cv2.IMREAD_COLOR),
+                                          cv2.rotate(img, cv2.ROTATE_180))
+
+        # Formats that can't be encoded are returned as JPEG
+        response = client.post('/orient', content_type='multipart/form-data',
+                               data={'image': (io.BytesIO(cv2.imencode('.png', img)[1].tobytes()), 'gates_up.gif')})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_type, 'image/jpeg')
+
+    def test_fix_orientation_streamed_via_rest_api(self):
+        """Checks fixing the orientation of raw (non-multipart) uploads, output formats and size limits"""
+        client = app.test_client()
+        client.testing = True
+        img = os.path.join(os.path.dirname(__file__), 'res', 'gates_left.jpg')
+        with open(img, 'rb') as img_fp:
+            img_bytes = img_fp.read()
+
+        response = client.post('/orient', data=img_bytes, content_type='image/jpeg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_type, 'image/jpeg')
+        self.assertEqual(response.data, FaceOrienter(img).get_fixed_image_bytes('.jpg'))
+
+        # Output format and quality
+        response = client.post('/orient?format=png', data=img_bytes, content_type='image/jpeg')
+        self.assertEqual(response.content_type, 'image/png')
+        self.assertEqual(FaceOrienter.from_bytes(response.data).predict_orientation(), 'down')
+        response_low_quality = client.post('/orient?quality=10', data=img_bytes, content_type='image/jpeg')
+        self.assertLess(len(response_low_quality.data), len(client.post('/orient', data=img_bytes,
+                                                                         content_type='image/jpeg').data))
+        self.assertEqual(client.post('/orient?format=gif', data=img_bytes, content_type='image/jpeg').status_code, 400)
+        self.assertEqual(client.post('/orient?quality=0', data=img_bytes, content_type='image/jpeg').status_code, 400)
+        self.assertEqual(client.post('/orient', data=b'', content_type='text/plain').status_code, 400)
+
+        # Size limits (the image has 399x399 pixels)
+        max_content_length, max_image_pixels = app.config['MAX_CONTENT_LENGTH'], app.config['MAX_IMAGE_PIXELS']
+        try:
+            app.config['MAX_CONTENT_LENGTH'] = len(img_bytes) - 1
+            self.assertEqual(client.post('/orient', data=img_bytes, content_type='image/jpeg').status_code, 413)
+            app.config.update(MAX_CONTENT_LENGTH=max_content_length, MAX_IMAGE_PIXELS=399 * 398)
+            response = client.post('/orient', data=img_bytes, content_type='image/jpeg')
+            self.assertEqual(response.status_code, 413)
+            self.assertIn('399x399', response.get_json()['error'])
+        finally:
+            app.config.update(MAX_CONTENT_LENGTH=max_content_length, MAX_IMAGE_PIXELS=max_image_pixels)
+
+    def test_predict_via_rest_api(self):
+        """Checks if predicting the orientation using the REST API returns the expected JSON"""
+        client = app.test_client()
+        client.testing = True
+        img = os.path.join(os.path.dirname(__file__), 'res', 'gates_up.jpg')
+
+        with open(img, 'rb') as img_fp:
+            response = client.post('/predict', content_type='multipart/form-data',
+                                   data={'image': (img_fp, 'gates_up.jpg')})
+        result = response.get_json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(result['orientation'], 'up')
+        self.assertGreater(result['confidence'], 0.5)
+        self.assertEqual(result['n_rotations'], FaceOrienter(img).n_rotations)
+        self.assertEqual(len(result['landmarks']), 5)
+
+        # The landmarks are returned in the coordinates of the original image, i.e. they should be within the face
+        face_rect = result['face_rect']
+        for x, y in result['landmarks']:
+            self.assertTrue(face_rect['left'] <= x <= face_rect['right'])
+            self.assertTrue(face_rect['top'] <= y <= face_rect['bottom'])
+
+        # The face's bounding box can be passed on as region of interest
+        roi = ','.join(str(face_rect[key]) for key in ('left', 'top', 'right', 'bottom'))
+        with open(img, 'rb') as img_fp:
+            response = client.post('/predict?roi=%s' % roi, data=img_fp.read(), content_type='image/jpeg')
+        self.assertEqual(response.get_json()['orientation'], 'up')
+        self.assertTrue(response.get_json()['roi_hit'])
+        with open(img, 'rb') as img_fp:
+            response = client.post('/predict?roi=1,2,3', data=img_fp.read(), content_type='image/jpeg')
+        self.assertEqual(response.status_code, 400)
+
+        # Missing or invalid images
+        self.assertEqual(client.post('/predict', content_type='multipart/form-data', data={}).status_code, 400)
+        with open(__file__, 'rb') as invalid_fp:
+            response = client.post('/predict', content_type='multipart/form-data',
+                                   data={'image': (invalid_fp, 'invalid.jpg')})
+        self.assertEqual(response.status_code, 400)
+
+    def test_predict_batch_via_rest_api(self):
+        """Checks if predicting the orientation of multiple images using the REST API returns all results in order"""
+        client = app.test_client()
+        client.testing = True
+        res_dir = os.path.join(os.path.dirname(__file__), 'res')
+        orientations = ['left', 'right', 'up', 'down']
+
+        files = [open(os.path.join(res_dir, 'gates_%s.jpg' % orientation), 'rb') for orientation in orientations]
+        files.append(open(__file__, 'rb'))
+        try:
+            response = client.post('/predict/batch', content_type='multipart/form-data',
+                                   data={'image': [(f, os.path.basename(f.name)) for f in files]})
+        finally:
+            for f in files:
+                f.close()
+        results = response.get_json()['results']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result.get('orientation') for result in results], orientations + [None])
+        self.assertEqual([result['filename'] for result in results],
+                         ['gates_%s.jpg' % orientation for orientation in orientations] + ['test_rest_api.py'])
+        self.assertTrue('error' in results[-1])
+
+        # A region of interest applies to all images
+        with open(os.path.join(res_dir, 'gates_up.jpg'), 'rb') as img_fp:
+            face_rect = client.post('/predict', data=img_fp.read(), content_type='image/jpeg').get_json()['face_rect']
+        roi = ','.join(str(face_rect[key]) for key in ('left', 'top', 'right', 'bottom'))
+        with open(os.path.join(res_dir, 'gates_up.jpg'), 'rb') as img_fp:
+            response = client.post('/predict/batch?roi=%s' % roi, content_type='multipart/form-data',
+                                   data={'image': [(img_fp, 'gates_up.jpg')]})
+        self.assertTrue(response.get_json()['results'][0]['roi_hit'])
+        self.assertEqual(client.post('/predict/batch?roi=1,2,3', content_type='multipart/form-data',
+                                     data={'image': [(io.BytesIO(b'x'), 'x.jpg')]}).status_code, 400)
+
+    def test_server_busy(self):
+        """Checks if requests are rejected with 503 (and a `Retry-After` header) while the queue is full"""
+        client = app.test_client()
+        client.testing = True
+        with open(os.path.join(os.path.dirname(__file__), 'res', 'gates_up.jpg'), 'rb') as img_fp:
+            img_bytes = img_fp.read()
+
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        # Occupy the only worker, and fill the queue
+        scheduler = InferenceScheduler(routes._run_task, workers=1, max_queue_size=1)
+        self.addCleanup(setattr, routes, '_scheduler', routes._scheduler)
+        routes._scheduler = scheduler
+        scheduler.submit(block)
+        started.wait(5)
+        scheduler.submit(block)
+
+        try:
+            for endpoint in ('/predict', '/orient'):
+                response = client.post(endpoint, data=img_bytes, content_type='image/jpeg')
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response.headers.get('Retry-After'), '1')
+        finally:
+            release.set()
+
+    def test_predict_batch_larger_than_queue(self):
+        """Checks if batches with more images than the queue can hold are processed completely"""
+        client = app.test_client()
+        client.testing = True
+        img = os.path.join(os.path.dirname(__file__), 'res', 'black_square.jpg')
+
+        scheduler = InferenceScheduler(routes._run_task, workers=1, max_queue_size=2)
+        self.addCleanup(setattr, routes, '_scheduler', routes._scheduler)
+        routes._scheduler = scheduler
+
+        files = [open(img, 'rb') for _ in range(10)]
+        try:
+            response = client.post('/predict/batch', content_type='multipart/form-data',
+                                   data={'image': [(f, 'black_square_%d.jpg' % i) for i, f in enumerate(files)]})
+        finally:
+            for f in files:
+                f.close()
+        results = response.get_json()['results']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['filename'] for result in results], ['black_square_%d.jpg' % i for i in range(10)])
+        self.assertFalse(any('error' in result for result in results))
+        self.assertEqual(scheduler.n_tasks, 10)
@@ -0,0 +1,115 @@
+import os
+from unittest import TestCase
+
+import cv2
+
+from faceorienter import FaceOrienter
+from faceorienter.cache import LRUCache
+from faceorienter.rotation_order import RotationOrderScheduler, apply_hint
+from faceorienter.server import app, routes
+
+
+class TestRotationOrder(TestCase):
+    res_dir = os.path.join(os.path.dirname(__file__), 'res')
+
+    def test_order(self):
+        """Checks if the scheduler learns the most frequent orientations (per context) and respects hints and priors"""
+        self.assertEqual(apply_hint((0, 1, 2, 3), 2), [2, 0, 1, 3])
+        self.assertEqual(apply_hint((0, 1, 2, 3), None), [0, 1, 2, 3])
+
+        scheduler = RotationOrderScheduler()
+        self.assertEqual(scheduler.get_order(), [0, 1, 2, 3])
+
+        for _ in range(3):
+            scheduler.update(3, 2)
+        scheduler.update(1, 2, context=6)
+        scheduler.update(None, 4)
+
+        # Without context-specific counts, the counts across all contexts decide
+        self.assertEqual(scheduler.get_order(), [3, 1, 0, 2])
+        self.assertEqual(scheduler.get_order(context=6), [1, 3, 0, 2])
+        self.assertEqual(scheduler.get_order(context=6, hint=2), [2, 1, 3, 0])
+
+        stats = scheduler.stats()
+        self.assertEqual(stats['order'], [3, 1, 0, 2])
+        self.assertEqual(stats['counts'], {'None': [0, 0, 0, 3], '6': [0, 1, 0, 0]})
+        self.assertEqual((stats['images'], stats['no_face'], stats['detection_passes']), (5, 1, 12))
+        self.assertAlmostEqual(stats['mean_detection_passes'], 12 / 5.)
+
+        # Priors, and disabled learning
+        scheduler = RotationOrderScheduler(prior_counts=[1, 5, 0, 0], learn=False)
+        scheduler.update(3, 1)
+        self.assertEqual(scheduler.get_order(), [1, 0, 2, 3])
+        self.assertRaises(ValueError, RotationOrderScheduler, [1, 2])
+
+    def test_face_orienter(self):
+        """Checks if detection tries the hinted/learned orientation first, without changing the prediction"""
+        img = os.path.join(self.res_dir, 'gates_left.jpg')
+        expected = FaceOrienter(img)
+
+        scheduler = RotationOrderScheduler()
+        for _ in range(2):
+            fo = FaceOrienter(img, rotation_order=scheduler)
+            self.assertEqual(fo.predict_orientation(), 'left')
+            self.assertEqual(fo.n_rotations, expected.n_rotations)
+
+        # The second image only required a single detector pass, since the learned orientation was tried first
+        self.assertEqual(scheduler.stats()['detection_passes'], expected.n_rotations + 2)
+
+        fo = FaceOrienter(img, orientation_hint='left', rotation_order=RotationOrderScheduler())
+        self.assertEqual(fo.predict_orientation(), 'left')
+        self.assertEqual(fo.rotation_order.stats()['detection_passes'], 1)
+
+        self.assertRaises(ValueError, FaceOrienter, img, orientation_hint='sideways')
+
+    def test_prediction_independent_of_order(self):
+        """Checks if small faces, which are only found if upsampled, are predicted the same regardless of the order"""
+        for orientation in ('down', 'left', 'right', 'up'):
+            img = cv2.resize(cv2.imread(os.path.join(self.res_dir, 'gates_%s.jpg' % orientation)), (120, 120))
+            expected = FaceOrienter.from_array(img).predict_orientation_with_confidence()
+
+            for n_rotations in range(4):
+                prior_counts = [5 if n == n_rotations else 0 for n in range(4)]
+                fo = FaceOrienter.from_array(img, rotation_order=RotationOrderScheduler(prior_counts))
+                self.assertEqual(fo.predict_orientation_with_confidence(), expected)
+
+                fo = FaceOrienter.from_array(img, orientation_hint=orientation)
+                self.assertEqual(fo.predict_orientation_with_confidence(), expected)
+
+    def test_cache_key(self):
+        """Checks if predictions using different orders are cached separately"""
+        with open(os.path.join(self.res_dir, 'gates_left.jpg'), 'rb') as img_fp:
+            img_bytes = img_fp.read()
+
+        cache = LRUCache()
+        FaceOrienter.from_bytes(img_bytes, cache=cache)
+        FaceOrienter.from_bytes(img_bytes, cache=cache, orientation_hint='left')
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        FaceOrienter.from_bytes(img_bytes, cache=cache, orientation_hint='left')
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_rest_api(self):
+        """Checks if hints are accepted and the statistics are exposed by the REST API"""
+        client = app.test_client()
+        client.testing = True
+
+        # The adaptive rotation order is disabled by default
+        self.assertEqual(client.get('/rotation-order').status_code, 404)
+        app.config['ADAPTIVE_ROTATION_ORDER'] = True
+        self.addCleanup(app.config.update, ADAPTIVE_ROTATION_ORDER=False)
+        self.addCleanup(setattr, routes, '_rotation_order', None)
+
+        with open(os.path.join(self.res_dir, 'gates_right.jpg'), 'rb') as img_fp:
+            response = client.post('/predict?orientation_hint=right', content_type='multipart/form-data',
+                                   data={'image': (img_fp, 'gates_right.jpg')})
+        self.assertEqual(response.get_json()['orientation'], 'right')
+
+        with open(os.path.join(self.res_dir, 'gates_right.jpg'), 'rb') as img_fp:
+            response = client.post('/predict?orientation_hint=sideways', content_type='multipart/form-data',
+                                   data={'image': (img_fp, 'gates_right.jpg')})
+        self.assertEqual(response.status_code, 400)
+
+        stats = client.get('/rotation-order').get_json()
+        self.assertEqual(sorted(stats['order']), [0, 1, 2, 3])
+        self.assertIn('mean_detection_passes', stats)
+        self.assertIn('faceorienter_rotation_order_detection_passes', client.get('/metrics').get_data(as_text=True))
@@ -0,0 +1,65 @@
+import threading
+import time
+from unittest import TestCase
+
+from faceorienter.server.scheduler import InferenceScheduler, QueueFullError
+
+
+class TestScheduler(TestCase):
+    def test_results(self):
+        """Checks if each task's result (or exception) is returned to the right caller"""
+        scheduler = InferenceScheduler(lambda x: 10 // x, workers=2)
+        futures = [scheduler.submit(x) for x in (1, 2, 5, 0, 10)]
+
+        self.assertEqual([future.result(timeout=5) for future in futures[:3]], [10, 5, 2])
+        self.assertRaises(ZeroDivisionError, futures[3].result, 5)
+        self.assertEqual(futures[4].result(timeout=5), 1)
+
+    def test_queueing(self):
+        """Checks if tasks that are submitted while the worker is busy wait in the queue, and are processed in order"""
+        started, release = threading.Event(), threading.Event()
+
+        def func(x):
+            if x == 0:
+                started.set()
+                release.wait(5)
+            return x
+
+        scheduler = InferenceScheduler(func, workers=1, max_queue_size=16)
+        futures = [scheduler.submit(0)]
+        started.wait(5)
+
+        # While the only worker is busy, tasks wait in the queue
+        futures += [scheduler.submit(x) for x in range(1, 9)]
+        self.assertEqual(scheduler.queue_depth, 8)
+
+        release.set()
+        self.assertEqual([future.result(timeout=5) for future in futures], list(range(9)))
+        self.assertEqual(scheduler.n_tasks, 9)
+        self.assertEqual(scheduler.queue_depth, 0)
+
+    def test_latency(self):
+        """Checks if a task is dispatched immediately if a worker is available (instead of lingering for more tasks)"""
+        scheduler = InferenceScheduler(lambda x: x, workers=1)
+        start = time.perf_counter()
+        for x in range(50):
+            self.assertEqual(scheduler.submit(x).result(timeout=5), x)
+        self.assertLess((time.perf_counter() - start) / 50, 0.005)
+
+    def test_backpressure(self):
+        """Checks if submitting a task fails when the queue is full"""
+        started, release = threading.Event(), threading.Event()
+
+        def func(x):
+            started.set()
+            release.wait(5)
+            return x
+
+        scheduler = InferenceScheduler(func, workers=1, max_queue_size=2)
+        futures = [scheduler.submit(0)]
+        started.wait(5)
+        futures += [scheduler.submit(1), scheduler.submit(2)]
+        self.assertRaises(QueueFullError, scheduler.submit, 3)
+
+        release.set()
+        self.assertEqual([future.result(timeout=5) for future in futures], [0, 1, 2])
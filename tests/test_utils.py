@@ -1,7 +1,9 @@
 import json
 import os
+import shutil
+import struct
 from dlib import full_object_detection, rectangle, point
-from unittest import TestCase
+from unittest import TestCase, skipUnless
 
 import cv2
 import numpy as np
@@ -9,10 +11,20 @@ import numpy as np
 from faceorienter.faceorienter import utils
 
 
+def add_exif_orientation(jpeg_bytes, orientation):
+    """Inserts an EXIF segment (APP1) containing only the orientation tag right after the JPEG's SOI marker"""
+    tiff = b'MM' + struct.pack('>HIH', 42, 8, 1) + struct.pack('>HHIHH', 0x0112, 3, 1, orientation, 0) + b'\x00' * 4
+    app1 = b'Exif\x00\x00' + tiff
+
+    return jpeg_bytes[:2] + b'\xff\xe1' + struct.pack('>H', len(app1) + 2) + app1 + jpeg_bytes[2:]
+
+
 class TestUtils(TestCase):
     @classmethod
     def setUpClass(cls):
         cls.example_img = cv2.imread(os.path.join(os.path.dirname(__file__), 'res', 'smiley_orig.jpg'))
+        with open(os.path.join(os.path.dirname(__file__), 'res', 'smiley_orig.jpg'), 'rb') as img_fp:
+            cls.example_jpeg = img_fp.read()
 
     def test_dlib_shape_to_np_array_invalid_args(self):
         """Checks behavior if invalid arguments are passed to utils.dlib_shape_to_np_array"""
@@ -57,7 +69,6 @@ class TestUtils(TestCase):
             (None, (TypeError, AttributeError)),  # Not a numpy array
             (np.array([]), ValueError),  # Empty numpy array
             (np.array([1, 1, 1, 1]), ValueError),  # Invalid array dimensions
-            (np.array([[1, 1], [1, 1]]), cv2.error)  # Dimensions ok, but not an image
         ]
 
         invalid_angle_args = [
@@ -73,6 +84,9 @@ class TestUtils(TestCase):
         for arg, err in invalid_angle_args:
             self.assertRaises(err, utils.rotate_image, self.example_img, arg)
 
+        # Dimensions ok, but not an image (only fails for arbitrary angles, since quarter turns work on any array)
+        self.assertRaises(cv2.error, utils.rotate_image, np.array([[1, 1], [1, 1]]), 45)
+
     def test_rotate_image_results(self):
         """Rotates an example image and checks if the resulting array is as expected"""
         with open(os.path.join(os.path.dirname(__file__), 'res', 'expected_rotation_results.json'), 'r') as result_file:
@@ -82,3 +96,94 @@ class TestUtils(TestCase):
             angle %= 360
             self.assertEqual(np.array_equal(utils.rotate_image(self.example_img, angle), expected_results[str(angle)]),
                              True)
+
+    def test_rotate_image_quarter_turns(self):
+        """Checks if rotations by multiples of 90 degrees are lossless, and don't copy the image"""
+        expected_results = {
+            0: self.example_img,
+            90: cv2.rotate(self.example_img, cv2.ROTATE_90_CLOCKWISE),
+            180: cv2.rotate(self.example_img, cv2.ROTATE_180),
+            270: cv2.rotate(self.example_img, cv2.ROTATE_90_COUNTERCLOCKWISE),
+        }
+
+        for angle in (0, 90, 180, 270, 360, 450, -90, 90.):
+            rotated = utils.rotate_image(self.example_img, angle)
+            self.assertTrue(np.array_equal(rotated, expected_results[int(angle) % 360]))
+            self.assertTrue(np.shares_memory(rotated, self.example_img))
+
+            rotated = utils.rotate_image(self.example_img, angle, contiguous=True)
+            self.assertTrue(np.array_equal(rotated, expected_results[int(angle) % 360]))
+            self.assertTrue(rotated.flags['C_CONTIGUOUS'])
+
+    def test_unrotate_points(self):
+        """Checks if points in a rotated image are mapped back to their original positions"""
+        img = np.zeros((30, 50), dtype=np.uint8)
+        points = np.array([[3, 7], [40, 20], [49, 29]])
+        img[points[:, 1], points[:, 0]] = 255
+
+        for n_rotations in range(0, 4):
+            ys, xs = np.nonzero(utils.rotate_image(img, n_rotations * 90))
+            unrotated = utils.unrotate_points(np.stack([xs, ys], axis=1), n_rotations, (50, 30))
+            self.assertEqual(sorted(map(tuple, unrotated.tolist())), sorted(map(tuple, points.tolist())))
+
+    def test_rotate_points(self):
+        """Checks if rotating points is the inverse of unrotating them, and matches rotating the image"""
+        points = np.array([[3, 5], [0, 0], [9, 6]])
+        img = np.zeros((7, 10), dtype=np.uint8)
+        img[points[:, 1], points[:, 0]] = [1, 2, 3]
+        for n_rotations in range(4):
+            rotated = utils.rotate_points(points, n_rotations, (10, 7))
+            self.assertTrue(np.array_equal(utils.unrotate_points(rotated, n_rotations, (10, 7)), points))
+            img_rotated = utils.rotate_image(img, n_rotations * 90)
+            self.assertEqual(img_rotated[rotated[:, 1], rotated[:, 0]].tolist(), [1, 2, 3])
+
+    def test_read_jpeg_orientation(self):
+        """Checks if the EXIF orientation tag is read (and reset) correctly, without decoding the image"""
+        self.assertEqual(utils.read_jpeg_orientation(self.example_jpeg), None)
+        self.assertEqual(utils.read_jpeg_orientation(b'not a jpeg'), None)
+        self.assertEqual(utils.read_jpeg_orientation(self.example_jpeg[:20]), None)
+
+        for orientation in range(1, 9):
+            jpeg = add_exif_orientation(self.example_jpeg, orientation)
+            self.assertEqual(utils.read_jpeg_orientation(jpeg), orientation)
+            self.assertEqual(utils.read_jpeg_orientation(utils.reset_jpeg_orientation(jpeg)), 1)
+
+    def test_read_jpeg_size(self):
+        """Checks if the image dimensions are read correctly from the JPEG header"""
+        self.assertEqual(utils.read_jpeg_size(self.example_jpeg), (480, 480))
+        self.assertEqual(utils.read_jpeg_size(add_exif_orientation(self.example_jpeg, 6)), (480, 480))
+        self.assertEqual(utils.read_jpeg_size(b'not a jpeg'), None)
+
+    def test_read_image_size(self):
+        """Checks if the image dimensions are read correctly from JPEG and PNG headers"""
+        self.assertEqual(utils.read_image_size(bytearray(self.example_jpeg)), (480, 480))
+        png = cv2.imencode('.png', np.zeros((30, 40, 3), dtype=np.uint8))[1].tobytes()
+        self.assertEqual(utils.read_image_size(png), (40, 30))
+        self.assertEqual(utils.read_image_size(b'not an image'), None)
+
+    def test_decode_reduced_grayscale(self):
+        """Checks if the largest possible reduction is chosen when decoding at a reduced resolution"""
+        for min_side, expected_shape in ((50, (60, 60)), (100, (120, 120)), (200, (240, 240)), (300, None)):
+            reduced = utils.decode_reduced_grayscale(self.example_jpeg, min_side)
+            if expected_shape is None:
+                self.assertEqual(reduced, None)
+            else:
+                self.assertEqual(reduced[0].shape, expected_shape)
+                self.assertEqual(reduced[1], expected_shape[0] / 480.)
+
+        self.assertEqual(utils.decode_reduced_grayscale(cv2.imencode('.png', self.example_img)[1].tobytes(), 50), None)
+
+    @skipUnless(shutil.which('jpegtran'), 'jpegtran is not installed')
+    def test_rotate_jpeg_lossless(self):
+        """Checks if JPEGs are rotated losslessly (i.e. equal to rotating the decoded image), and if the EXIF
+        orientation is reset"""
+        jpeg = cv2.imencode('.jpg', self.example_img)[1].tobytes()  # 480x480, i.e. a multiple of the block size
+        decoded = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+        for angle in (90, 180, 270):
+            rotated = utils.rotate_jpeg_lossless(add_exif_orientation(jpeg, 1), angle)
+            self.assertEqual(utils.read_jpeg_orientation(rotated), 1)
+            self.assertTrue(np.array_equal(cv2.imdecode(np.frombuffer(rotated, dtype=np.uint8), cv2.IMREAD_COLOR),
+                                           utils.rotate_image(decoded, angle)))
+
+        self.assertRaises(ValueError, utils.rotate_jpeg_lossless, jpeg, 45)
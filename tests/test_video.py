@@ -0,0 +1,89 @@
+import os
+from tempfile import mkdtemp
+from shutil import rmtree
+from unittest import TestCase
+
+import cv2
+import numpy as np
+
+from faceorienter import FaceOrienter
+from faceorienter.video import VideoOrienter, iter_frames
+
+
+class TestVideo(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = mkdtemp()
+
+        # Frames of a face (oriented `left`) moving across a black background
+        img = cv2.imread(os.path.join(os.path.dirname(__file__), 'res', 'gates_left.jpg'))
+        cls.frames = []
+        for i in range(12):
+            frame = np.zeros((500, 640, 3), dtype=np.uint8)
+            frame[50:50 + img.shape[0], 20 + 10 * i:20 + 10 * i + img.shape[1]] = img
+            cls.frames.append(frame)
+
+        cls.video_path = os.path.join(cls.tmp_dir, 'video.mp4')
+        writer = cv2.VideoWriter(cls.video_path, cv2.VideoWriter_fourcc(*'mp4v'), 10., (640, 500))
+        for frame in cls.frames:
+            writer.write(frame)
+        writer.release()
+
+    @classmethod
+    def tearDownClass(cls):
+        rmtree(cls.tmp_dir)
+
+    def test_video(self):
+        """Checks if the orientation of a video is predicted from sampled frames, reusing previous face regions, and if
+        the fixed video is written correctly"""
+        vo = VideoOrienter(self.video_path, sample_every=3)
+        self.assertEqual([i for i, _, _ in vo.samples], [0, 3, 6, 9])
+        self.assertEqual(vo.predict_orientation(), 'left')
+        self.assertGreater(vo.confidence, 0.5)
+
+        # All samples after the first one found the face in the previous face's region
+        self.assertEqual(vo.n_region_hits, 3)
+        self.assertEqual(len(VideoOrienter(self.video_path, sample_every=3, max_samples=2).samples), 2)
+
+        fixed_path = os.path.join(self.tmp_dir, 'fixed.mp4')
+        vo.fix_orientation(fixed_path)
+        fixed_frames = list(iter_frames(fixed_path))
+        self.assertEqual(len(fixed_frames), len(self.frames))
+        self.assertEqual(fixed_frames[0].shape, (640, 500, 3))
+        self.assertEqual(FaceOrienter.from_array(fixed_frames[0]).predict_orientation(), 'down')
+
+        self.assertRaises(ValueError, VideoOrienter, self.video_path, sample_every=0)
+        self.assertRaises(FileNotFoundError, VideoOrienter, '/some/non/existing/video.mp4')
+
+    def test_sampling(self):
+        """Checks if only sampled frames are yielded (and decoded)"""
+        all_frames = list(iter_frames(self.video_path))
+        sampled_frames = list(iter_frames(self.video_path, sample_every=5))
+        self.assertEqual(len(sampled_frames), 3)
+        for frame, expected in zip(sampled_frames, all_frames[::5]):
+            np.testing.assert_array_equal(frame, expected)
+
+        # Skipped images of a sequence are not read (so broken ones don't matter)
+        frames = [self.frames[0], '/some/non/existing/image.jpg', self.frames[2]]
+        self.assertEqual(len(list(iter_frames(frames, sample_every=2))), 2)
+        self.assertRaises(ValueError, list, iter_frames(frames))
+
+    def test_image_sequence(self):
+        """Checks if image sequences (lists of frames, or directories) are oriented and written frame by frame"""
+        vo = VideoOrienter(self.frames, sample_every=4)
+        self.assertEqual(vo.predict_orientation_with_confidence()[0], 'left')
+
+        fixed_dir = os.path.join(self.tmp_dir, 'fixed')
+        vo.fix_orientation(fixed_dir)
+        self.assertEqual(len(os.listdir(fixed_dir)), len(self.frames))
+
+        # The fixed directory is an image sequence itself, whose frames keep their names
+        vo = VideoOrienter(fixed_dir, sample_every=4)
+        self.assertEqual(vo.predict_orientation(), 'down')
+        vo.fix_orientation(os.path.join(self.tmp_dir, 'fixed_again'))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp_dir, 'fixed_again'))), sorted(os.listdir(fixed_dir)))
+
+        # Without faces, the orientation is unknown
+        vo = VideoOrienter([np.zeros((100, 100, 3), dtype=np.uint8)] * 3, sample_every=1)
+        self.assertEqual(vo.predict_orientation_with_confidence(), (None, 0.))
+        self.assertEqual(vo.predict_orientation(), 'down')
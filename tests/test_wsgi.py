@@ -0,0 +1,115 @@
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+import cv2
+
+from faceorienter.server import app
+from faceorienter.server.wsgi import PreforkServer
+
+
+class TestWSGI(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.project_dir = os.path.dirname(os.path.dirname(__file__))
+        cls.gates_images = {orientation: os.path.join(cls.project_dir, 'tests', 'res', 'gates_%s.jpg' % orientation)
+                            for orientation in ('down', 'left', 'right', 'up')}
+
+    def test_config(self):
+        """Checks if the options are applied to gunicorn's config, and if the app is loaded as it is"""
+        server = PreforkServer(app, {'bind': '127.0.0.1:5001', 'workers': 3, 'threads': 2, 'worker_class': 'gthread',
+                                     'timeout': 10, 'preload_app': True})
+
+        self.assertEqual(server.cfg.bind, ['127.0.0.1:5001'])
+        self.assertEqual(server.cfg.workers, 3)
+        self.assertEqual(server.cfg.threads, 2)
+        self.assertEqual(server.cfg.worker_class_str, 'gthread')
+        self.assertEqual(server.cfg.timeout, 10)
+        self.assertTrue(server.cfg.preload_app)
+        self.assertIs(server.load(), app)
+
+        # Unknown settings are rejected (gunicorn exits) instead of being silently ignored
+        self.assertRaises(SystemExit, PreforkServer, app, {'no_such_setting': 1})
+
+    def _start_server(self, *args):
+        """Starts the server (with the given command line arguments) on a free port, and waits until it is ready"""
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        url = 'http://127.0.0.1:%d' % port
+
+        process = subprocess.Popen([sys.executable, '-m', 'faceorienter.server', '-s', '127.0.0.1', '-p', str(port)]
+                                   + list(args), cwd=self.project_dir, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL)
+
+        # Wait until the models are loaded and the workers are forked
+        deadline = time.time() + 60
+        while True:
+            try:
+                urlopen(url + '/metrics', timeout=5).read()
+                return process, url
+            except URLError:
+                if process.poll() is not None or time.time() > deadline:
+                    process.kill()
+                    process.wait()
+                    self.fail('The server did not start.')
+                time.sleep(0.2)
+
+    def test_serve(self):
+        """Starts the server with several worker processes and checks if they answer requests"""
+        process, url = self._start_server('-w', '2', '-t', '2')
+        try:
+            # Requests are answered by the forked worker processes, not by the master process
+            metrics_text = urlopen(url + '/metrics', timeout=5).read().decode()
+            worker_pid = int(re.search(r'worker_pid (\d+)', metrics_text).group(1))
+            self.assertNotEqual(worker_pid, process.pid)
+
+            for orientation, img_path in self.gates_images.items():
+                with open(img_path, 'rb') as img_fp:
+                    request = Request(url + '/predict', data=img_fp.read(), headers={'Content-Type': 'image/jpeg'})
+                self.assertEqual(json.loads(urlopen(request, timeout=30).read().decode())['orientation'], orientation)
+        finally:
+            process.terminate()
+            process.wait(30)
+
+    def test_backpressure(self):
+        """Checks if requests exceeding the queue (derived from the number of threads) are rejected with 503"""
+        # 4 threads and 1 detector thread: 1 request is processed, 2 wait in the queue, and the 4th is rejected
+        process, url = self._start_server('-w', '1', '-t', '4', '--detector-workers', '1', '--cache-size', '0')
+        img = cv2.imread(self.gates_images['up'])
+        img = cv2.resize(img, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+        img_bytes = cv2.imencode('.jpg', img)[1].tobytes()
+
+        def post(_):
+            request = Request(url + '/predict', data=img_bytes, headers={'Content-Type': 'image/jpeg'})
+            try:
+                return urlopen(request, timeout=60).status, None
+            except HTTPError as e:
+                return e.code, e.headers.get('Retry-After')
+
+        try:
+            with ThreadPoolExecutor(8) as executor:
+                responses = list(executor.map(post, range(8)))
+        finally:
+            process.terminate()
+            process.wait(30)
+
+        self.assertIn((200, None), responses)
+        self.assertIn((503, '1'), responses)
+        self.assertEqual({status for status, _ in responses}, {200, 503})
+
+    def test_queue_size(self):
+        """Checks if queue sizes that can never fill up are rejected"""
+        process = subprocess.run([sys.executable, '-m', 'faceorienter.server', '-t', '4', '--detector-workers', '2',
+                                  '--queue-size', '2'], cwd=self.project_dir, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, timeout=60)
+        self.assertEqual(process.returncode, 2)
+        self.assertIn(b'--queue-size must be smaller than --threads minus --detector-workers (2)', process.stderr)